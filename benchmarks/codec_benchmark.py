@@ -0,0 +1,96 @@
+"""
+Size and speed of stripe_subscription.codec compared with JSON for a page of subscriptions.
+Run from repository root:
+    python benchmarks/codec_benchmark.py [--count 1000] [--repeat 5]
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stripe_subscription import codec  # noqa: E402
+from stripe_subscription.serializers import StripeApiSubscription  # noqa: E402
+
+
+def make_subscriptions(count):
+    created = datetime.datetime(2026, 1, 1)
+    return [
+        StripeApiSubscription(
+            id=f"sub_{number:014d}",
+            customer=f"cus_{number % 300:014d}",
+            status="active" if number % 10 else "past_due",
+            collection_method="charge_automatically",
+            created=created + datetime.timedelta(minutes=number),
+            start_date=created + datetime.timedelta(minutes=number),
+            current_period_start=created + datetime.timedelta(days=30, minutes=number),
+            current_period_end=created + datetime.timedelta(days=60, minutes=number),
+            items={"data": [{
+                "id": f"si_{number:014d}",
+                "quantity": 1,
+                "price": {
+                    "id": "price_00000000000001",
+                    "unit_amount": 799,
+                    "recurring": {"interval": "month", "interval_count": 1},
+                    "product": "prod_00000000000001"
+                }
+            }]}
+        )
+        for number in range(count)
+    ]
+
+
+def json_encode(subscriptions):
+    return json.dumps([subscription.dict() for subscription in subscriptions], default=str).encode()
+
+
+def json_decode(data):
+    # items validator takes Stripe list object, so items are wrapped back.
+    return [
+        StripeApiSubscription(**{**item, "items": {"data": item["items"]}})
+        for item in json.loads(data)
+    ]
+
+
+def best_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    subscriptions = make_subscriptions(args.count)
+    codec_data = codec.encode_many(subscriptions)
+    json_data = json_encode(subscriptions)
+    assert codec.decode_many(codec_data, StripeApiSubscription) == subscriptions
+    assert json_decode(json_data) == subscriptions
+    print(f"{args.count} subscriptions, best of {args.repeat}")
+    for name, data, encode, decode in (
+        ("json", json_data, json_encode, json_decode),
+        (
+            "codec",
+            codec_data,
+            codec.encode_many,
+            lambda data: codec.decode_many(data, StripeApiSubscription)
+        ),
+    ):
+        encode_time = best_time(lambda: encode(subscriptions), args.repeat)
+        decode_time = best_time(lambda: decode(data), args.repeat)
+        print(
+            f"{name:>6}: size={len(data) / 1024:8.1f}KiB "
+            f"encode={encode_time * 1000:7.2f}ms decode={decode_time * 1000:7.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Tail latency of reads with and without hedging against fake Stripe with heavy-tailed latency.
+Run from repository root:
+    python benchmarks/hedging_benchmark.py [--requests 400] [--concurrency 8]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stripe_subscription.base_api import StripeCustomerApi  # noqa: E402
+from stripe_subscription.hedging import RequestHedger  # noqa: E402
+
+
+class FakeStripe:
+
+    """
+    Customer.retrieve which takes 5-15ms usually and slow_latency with slow_share probability.
+    """
+
+    def __init__(
+        self,
+        slow_share: float = 0.03,
+        slow_latency: float = 0.3,
+        seed: int = 1
+    ) -> None:
+        self.slow_share = slow_share
+        self.slow_latency = slow_latency
+        self.requests_count = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def retrieve(self, customer_id, api_key=None):
+        with self._lock:
+            self.requests_count += 1
+            slow = self._random.random() < self.slow_share
+            latency = self._random.uniform(0.005, 0.015)
+        time.sleep(self.slow_latency if slow else latency)
+        return {
+            "id": customer_id,
+            "email": "email@example.com",
+            "object": "customer",
+            "balance": 0,
+            "created": 1672531200
+        }
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return {
+        name: latencies[min(int(p * len(latencies)), len(latencies) - 1)] * 1000
+        for name, p in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))
+    }
+
+
+def run(hedger, requests, concurrency):
+    server = FakeStripe()
+    api = StripeCustomerApi("sk_test_benchmark", hedger=hedger)
+
+    def read(number):
+        started = time.perf_counter()
+        api.get_by_id(f"cus_{number}")
+        return time.perf_counter() - started
+
+    with mock.patch("stripe.Customer.retrieve", server.retrieve):
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(read, range(requests)))
+    return latencies, server.requests_count
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    print(f"{args.requests} reads, {args.concurrency} threads, 3% of responses take 300ms")
+    for name, hedger in (
+        ("no hedging", None),
+        ("hedging", RequestHedger(minimum_samples=20, default_delay=0.05)),
+    ):
+        latencies, sent = run(hedger, args.requests, args.concurrency)
+        result = percentiles(latencies)
+        print(
+            f"{name:>12}: " +
+            " ".join(f"{key}={value:6.1f}ms" for key, value in result.items()) +
+            f" mean={statistics.mean(latencies) * 1000:6.1f}ms" +
+            f" extra requests={(sent - args.requests) / args.requests:.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
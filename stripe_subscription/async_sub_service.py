@@ -13,9 +13,22 @@ class AsyncStripeSubscriptionService:
 
     EXECUTOR = ThreadPoolExecutor(max_workers=5)
 
-    def __init__(self, api_key):
+    def __init__(self, api_key, **service_options):
+        """
+        :param service_options: Passed to StripeSubscriptionService.
+        """
         self.api_key = api_key
-        self.sync_service = StripeSubscriptionService(api_key)
+        self.sync_service = StripeSubscriptionService(api_key, **service_options)
+
+    @classmethod
+    def from_sync_service(cls, sync_service: StripeSubscriptionService):
+        """
+        Wraps existing service, e.g. shared one from StripeServiceRegistry.
+        """
+        service = cls.__new__(cls)
+        service.api_key = sync_service.api_key
+        service.sync_service = sync_service
+        return service
 
     async def get_or_create_customer(self, *args, **kwargs):
         loop = asyncio.get_event_loop()
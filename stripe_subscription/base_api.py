@@ -1,70 +1,428 @@
+import functools
+import hashlib
+import inspect
+import json
+import time
 import stripe
-from typing import Optional, List
+from concurrent.futures import Future
+from typing import Optional, List, Callable, Any, Hashable, Iterator, TYPE_CHECKING
+
+from stripe_subscription.circuit_breaker import CircuitBreaker
+from stripe_subscription.hedging import RequestHedger
+from stripe_subscription.negative_cache import NegativeCache, BloomFilter
+from stripe_subscription.rate_limit import RateLimiter
+from stripe_subscription.profiling import OperationProfiler, NetworkTimer, profile_phase, CLIENT
+from stripe_subscription.write_coalescing import WriteCoalescer
+
+# Seconds Stripe keeps idempotency keys.
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+if TYPE_CHECKING:
+    from stripe_subscription.serializers import (
+        StripeApiProduct,
+        StripeApiCustomer,
+        StripeApiSubscription,
+        StripeApiSession,
+        StripePaymentMethod,
+        StripeApiPrice,
+        StripeCurrencies,
+        StripePriceRecurring
+    )
+
+
+def _operation_key(
+    name: str,
+    signature: inspect.Signature,
+    args: tuple,
+    kwargs: dict
+) -> Hashable:
+    """
+    Builds hashable key of API call.
+    Positional and keyword arguments give the same key, serializers are replaced by their ids.
+    """
+    arguments = signature.bind(*args, **kwargs).arguments
+    return (name,) + tuple(
+        (argument, getattr(value, "id", value)) for argument, value in arguments.items()
+        if argument != "self"
+    )
+
+
+def read_operation(method):
+    """
+    Marks idempotent API method. Calls go through StripeApi._read.
+    Key of call is built only if client has breaker, negative cache or known keys.
+    """
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = None
+        if self._uses_read_keys():
+            key = _operation_key(method.__name__, signature, (self,) + args, kwargs)
+        return self._read(
+            method.__name__,
+            key,
+            functools.partial(method, self, *args, **kwargs)
+        )
+    return wrapper
+
 
-from stripe_subscription.serializers import (
-    StripeApiProduct,
-    StripeApiCustomer,
-    StripeApiSubscription,
-    StripeApiSession,
-    StripePaymentMethod,
-    StripeApiPrice,
-    StripeCurrencies,
-    StripePriceRecurring
-)
+def write_operation(method):
+    """
+    Marks API method which changes Stripe data. Calls go through StripeApi._request.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        return self._request(
+            functools.partial(method, self, *args, **kwargs)
+        )
+    return wrapper
 
 
 class StripeApi:
 
+    # Read operation which finds object by its unique natural key (email, lookup key...)
+    # and name of its argument. Used by known_keys Bloom filter.
+    LOOKUP_OPERATION = None
+    LOOKUP_ARGUMENT = None
+
     def __init__(
         self,
-        api_key: str
+        api_key: str,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        hedger: Optional[RequestHedger] = None,
+        negative_cache: Optional[NegativeCache] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        profiler: Optional[OperationProfiler] = None
     ) -> None:
         """
-        :param api_key: str - Api Key
+        :param api_key: str - Api Key. It's passed to every request,
+            global stripe.api_key isn't changed, so clients with different keys can work concurrently.
+        :param circuit_breaker: CircuitBreaker - Optional breaker for this endpoint family.
+        :param hedger: RequestHedger - Optional hedging of read requests.
+        :param negative_cache: NegativeCache - Optional cache of reads which returned nothing.
+        :param rate_limiter: RateLimiter - Optional limit of requests rate.
+        :param profiler: OperationProfiler - Enables network/parse timing of sampled operations.
+        """
+        self.stripe = stripe if profiler is None else NetworkTimer(stripe)
+        self.profiler = profiler
+        self.api_key = api_key
+        self.circuit_breaker = circuit_breaker
+        self.hedger = hedger
+        self.negative_cache = negative_cache
+        self.rate_limiter = rate_limiter
+        self.known_keys: Optional[BloomFilter] = None
+        self.known_keys_expires_at = 0.0
+
+    def load_known_keys(
+        self,
+        capacity: int = 100000,
+        error_rate: float = 0.01,
+        max_age: float = 3600.0
+    ) -> BloomFilter:
+        """
+        Loads natural keys of all objects into Bloom filter.
+        After that LOOKUP_OPERATION skips request for keys which definitely don't exist,
+        and create requests are sent with idempotency key.
+        Use it only if objects are created through this package,
+        objects created by other clients aren't known to filter.
+        Objects created by other processes after load are collapsed by idempotency key,
+        which is the same in every process, see _create_idempotency_key.
+        Filter is dropped after max_age, call load_known_keys() again to reload it.
+        :param max_age: float - Seconds filter is used. Stripe keeps idempotency keys
+            for 24 hours, so it can't be longer.
+        """
+        if self.LOOKUP_OPERATION is None:
+            raise NotImplementedError(
+                f"{type(self).__name__} has no lookup operation, known keys can't be loaded"
+            )
+        if max_age > IDEMPOTENCY_KEY_TTL:
+            raise ValueError(f"max_age can't be longer than {IDEMPOTENCY_KEY_TTL} seconds")
+        known_keys = BloomFilter(capacity=capacity, error_rate=error_rate)
+        for value in self._list_lookup_values():
+            known_keys.add(value)
+        self.known_keys = known_keys
+        self.known_keys_expires_at = time.monotonic() + max_age
+        return known_keys
+
+    def _list_lookup_values(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def _lookup_item(
+        self,
+        value: str
+    ) -> str:
+        """
+        Converts LOOKUP_ARGUMENT value into Bloom filter item.
+        """
+        return value
+
+    def _get_known_keys(self) -> Optional[BloomFilter]:
+        known_keys = self.known_keys
+        if known_keys is not None and time.monotonic() >= self.known_keys_expires_at:
+            self.known_keys = known_keys = None
+        return known_keys
+
+    def _uses_read_keys(self) -> bool:
+        return (
+            self.circuit_breaker is not None or
+            self.negative_cache is not None or
+            self._get_known_keys() is not None
+        )
+
+    def _is_missing(
+        self,
+        key: Hashable
+    ) -> bool:
+        if self.negative_cache is not None and key in self.negative_cache:
+            return True
+        known_keys = self._get_known_keys()
+        return (
+            known_keys is not None and
+            key[0] == self.LOOKUP_OPERATION and
+            self._lookup_item(key[1][1]) not in known_keys
+        )
+
+    def _add_known_key(
+        self,
+        value: str
+    ) -> None:
+        """
+        Must be called when object with LOOKUP_ARGUMENT value is created.
+        """
+        known_keys = self._get_known_keys()
+        if known_keys is not None:
+            known_keys.add(self._lookup_item(value))
+        if self.negative_cache is not None:
+            self.negative_cache.discard(
+                (self.LOOKUP_OPERATION, (self.LOOKUP_ARGUMENT, value))
+            )
+
+    def _create_idempotency_key(
+        self,
+        **params
+    ) -> Optional[str]:
+        """
+        With known_keys lookup is skipped for new values,
+        so the same object created concurrently is collapsed by Stripe idempotency key.
+        Key is hash of client name and create params only, so it's the same in every process
+        and the same key is always sent with the same params.
+        """
+        if self._get_known_keys() is None:
+            return None
+        payload = json.dumps(params, sort_keys=True, default=str)
+        digest = hashlib.sha256(payload.encode()).hexdigest()
+        return f"{type(self).__name__}.create.{digest}"
+
+    def _create(
+        self,
+        resource: str,
+        **params
+    ) -> dict:
+        """
+        Creates Stripe object, e.g. self._create("Customer", email=email).
+        With known_keys request is sent with idempotency key. Stripe replays the first response
+        of the key, even if that object was deleted or changed since. So replayed object is
+        checked, and if it's gone, object is created again with key of the replaced object
+        (it's the same in every process too).
+        """
+        resource_class = getattr(self.stripe, resource)
+        idempotency_key = self._create_idempotency_key(**params)
+        while True:
+            response = resource_class.create(
+                **params,
+                idempotency_key=idempotency_key,
+                api_key=self.api_key
+            )
+            if (
+                idempotency_key is None or
+                not self._is_gone_replay(resource_class, response, params)
+            ):
+                return response
+            idempotency_key = self._create_idempotency_key(replaced=response["id"], **params)
+
+    def _is_gone_replay(
+        self,
+        resource_class,
+        response,
+        params: dict
+    ) -> bool:
+        """
+        True if response is replayed by Stripe and its object was deleted,
+        deactivated or its create params were changed.
+        """
+        last_response = getattr(response, "last_response", None)
+        if last_response is None:
+            return False
+        headers = {name.lower(): value for name, value in (last_response.headers or {}).items()}
+        if headers.get("idempotent-replayed") != "true":
+            return False
+        try:
+            current = resource_class.retrieve(response["id"], api_key=self.api_key)
+        except stripe.error.InvalidRequestError:
+            return True
+        if current.get("deleted") or current.get("active") is False:
+            return True
+        return any(
+            current.get(name) != value for name, value in params.items()
+            if isinstance(value, (str, int))
+        )
+
+    def _profiled(
+        self,
+        fetch: Callable[[], Any]
+    ) -> Callable[[], Any]:
+        """
+        With profiler request time is counted into client phase.
         """
-        self.stripe = stripe
-        self.stripe.api_key = api_key
+        if self.profiler is None:
+            return fetch
+        return functools.partial(profile_phase, CLIENT, fetch)
+
+    def _acquire_token(self) -> None:
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+    def _read(
+        self,
+        operation: str,
+        key: Optional[Hashable],
+        fetch: Callable[[], Any]
+    ) -> Any:
+        """
+        Every request takes rate limiter token before it's sent (outside of breaker timing),
+        hedge is sent only if token is available at once.
+        Stale responses served by breaker take no token.
+        :param operation: str - Name of read operation.
+        :param key: Key of call, None if client doesn't use it (see _uses_read_keys).
+        """
+        if key is not None and self._is_missing(key):
+            return None
+        fetch = self._profiled(fetch)
+        if self.hedger is not None:
+            fetch = functools.partial(
+                self.hedger.call,
+                f"{type(self).__name__}.{operation}",
+                fetch,
+                self.rate_limiter.try_acquire if self.rate_limiter is not None else None
+            )
+        if self.circuit_breaker is None:
+            self._acquire_token()
+            value = fetch()
+        else:
+            value = self.circuit_breaker.read(key, fetch, self._acquire_token)
+        if value is None and self.negative_cache is not None:
+            self.negative_cache.add(key)
+        return value
+
+    def _request(
+        self,
+        fetch: Callable[[], Any]
+    ) -> Any:
+        """
+        Sends request which can't be served from cache (write or list page).
+        It takes rate limiter token and fails fast while breaker is open.
+        """
+        fetch = self._profiled(fetch)
+        if self.circuit_breaker is None:
+            self._acquire_token()
+            return fetch()
+        return self.circuit_breaker.write(fetch, self._acquire_token)
+
+    def _list_all(
+        self,
+        list_method: Callable,
+        **params
+    ) -> Iterator[dict]:
+        """
+        Iterates all objects of Stripe list (e.g. self.stripe.Customer.list).
+        Every page is separate request, see _request.
+        """
+        params.setdefault("limit", 100)
+        while True:
+            page = self._request(
+                functools.partial(list_method, **params, api_key=self.api_key)
+            )
+            yield from page["data"]
+            if not page["has_more"] or not page["data"]:
+                return
+            params["starting_after"] = page["data"][-1]["id"]
 
 
 class StripeCustomerApi(StripeApi):
 
+    LOOKUP_OPERATION = "get_by_email"
+    LOOKUP_ARGUMENT = "email"
+
+    def __init__(
+        self,
+        *args,
+        write_coalescing_options: Optional[dict] = None,
+        **kwargs
+    ) -> None:
+        """
+        :param write_coalescing_options: dict - Enables coalescing of modify_coalesced updates.
+            Options are passed to WriteCoalescer, e.g. {"window": 0.05}.
+        """
+        super().__init__(*args, **kwargs)
+        self.write_coalescer = None
+        if write_coalescing_options is not None:
+            self.write_coalescer = WriteCoalescer(
+                lambda customer_id, fields: self.modify(customer_id, **fields),
+                **write_coalescing_options
+            )
+
+    def _list_lookup_values(self) -> Iterator[str]:
+        for customer in self._list_all(self.stripe.Customer.list):
+            if customer.get("email"):
+                yield customer["email"]
+
+    @read_operation
     def get_by_id(
         self,
         customer_id: str
-    ) -> Optional[StripeApiCustomer]:
+    ) -> Optional["StripeApiCustomer"]:
         """
 
         """
-        response = self.stripe.Customer.retrieve(customer_id)
+        from stripe_subscription.serializers import StripeApiCustomer
+
+        response = self.stripe.Customer.retrieve(customer_id, api_key=self.api_key)
         customer = StripeApiCustomer(**response)
         return customer
 
+    @read_operation
     def get_by_email(
         self,
         email: str
-    ) -> Optional[StripeApiCustomer]:
+    ) -> Optional["StripeApiCustomer"]:
         """
 
         """
-        result = self.stripe.Customer.list(email=email)
+        from stripe_subscription.serializers import StripeApiCustomer
+
+        result = self.stripe.Customer.list(email=email, api_key=self.api_key)
         if result["data"]:
             customer = StripeApiCustomer(**result["data"][0])
             return customer
         return None
 
+    @write_operation
     def create(
         self,
         email: str
-    ) -> StripeApiCustomer:
+    ) -> "StripeApiCustomer":
         """
 
         """
-        response = self.stripe.Customer.create(
-            email = email
-        )
+        from stripe_subscription.serializers import StripeApiCustomer
+
+        response = self._create("Customer", email=email)
         customer = StripeApiCustomer(**response)
+        self._add_known_key(email)
         return customer
 
+    @write_operation
     def delete(
         self,
         customer_id: str
@@ -73,35 +431,82 @@ class StripeCustomerApi(StripeApi):
 
         """
         response = self.stripe.Customer.delete(
-            customer_id
+            customer_id,
+            api_key=self.api_key
         )
         return response["deleted"]
 
+    @write_operation
+    def modify(
+        self,
+        customer_id: str,
+        **fields
+    ) -> "StripeApiCustomer":
+        """
+        :param fields: Customer fields to update, e.g. name, metadata, invoice_settings.
+        """
+        from stripe_subscription.serializers import StripeApiCustomer
+
+        response = self.stripe.Customer.modify(
+            customer_id,
+            **fields,
+            api_key=self.api_key
+        )
+        customer = StripeApiCustomer(**response)
+        return customer
+
+    def modify_coalesced(
+        self,
+        customer_id: str,
+        **fields
+    ) -> "Future[StripeApiCustomer]":
+        """
+        Same as modify, but updates of the same customer made within coalescing window
+        are sent as one Customer.modify request (the last write wins per field)
+        in the order they were made.
+        Without write_coalescing_options update is sent at once.
+        :returns Future resolved with customer after merged update.
+        """
+        if self.write_coalescer is not None:
+            return self.write_coalescer.submit(customer_id, fields)
+        future = Future()
+        try:
+            future.set_result(self.modify(customer_id, **fields))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+    @read_operation
     def get_payment_methods(
         self,
-        customer: StripeApiCustomer
-    ) -> List[StripePaymentMethod]:
+        customer: "StripeApiCustomer"
+    ) -> List["StripePaymentMethod"]:
         """
 
         """
+        from stripe_subscription.serializers import StripePaymentMethod
+
         result = self.stripe.PaymentMethod.list(
-            customer=customer.id
+            customer=customer.id,
+            api_key=self.api_key
         )
         return [StripePaymentMethod(**method_dict) for method_dict in result["data"]]
 
 
 class StripePaymentMethodApi(StripeApi):
 
+    @write_operation
     def create(
         self,
         card_number: str,
         exp_month: int,
         exp_year: int,
         cvc: str
-    ) -> StripePaymentMethod:
+    ) -> "StripePaymentMethod":
         """
 
         """
+        from stripe_subscription.serializers import StripePaymentMethod
 
         response = self.stripe.PaymentMethod.create(
             type="card",
@@ -110,47 +515,63 @@ class StripePaymentMethodApi(StripeApi):
                 "exp_month": exp_month,
                 "exp_year": exp_year,
                 "cvc": cvc,
-            }
+            },
+            api_key=self.api_key
         )
         payment_method = StripePaymentMethod(**response)
         return payment_method
 
+    @read_operation
     def list(
             self,
             customer_id: str
-    ) -> List[StripePaymentMethod]:
+    ) -> List["StripePaymentMethod"]:
+        from stripe_subscription.serializers import StripePaymentMethod
+
         result = self.stripe.PaymentMethod.list(
             customer=customer_id,
-            type = 'card'
+            type = 'card',
+            api_key=self.api_key
         )
         methods = [
             StripePaymentMethod(**method) for method in result["data"]
         ]
         return methods
 
+    @write_operation
     def attach_to_customer(
         self,
-        payment_method: StripePaymentMethod,
-        customer: StripeApiCustomer
-    ) -> StripePaymentMethod:
+        payment_method: "StripePaymentMethod",
+        customer: "StripeApiCustomer"
+    ) -> "StripePaymentMethod":
         """
 
         """
+        from stripe_subscription.serializers import StripePaymentMethod
+
         response = self.stripe.PaymentMethod.attach(
-            payment_method.id, customer=customer.id
+            payment_method.id, customer=customer.id,
+            api_key=self.api_key
         )
         payment_method = StripePaymentMethod(**response)
         return payment_method
 
-    def detach_from_customer(self, method_id: str) -> StripePaymentMethod:
+    @write_operation
+    def detach_from_customer(self, method_id: str) -> "StripePaymentMethod":
+        from stripe_subscription.serializers import StripePaymentMethod
+
         response = self.stripe.PaymentMethod.detach(
-            method_id
+            method_id,
+            api_key=self.api_key
         )
         payment_method = StripePaymentMethod(**response)
         return payment_method
 
 class StripeProductApi(StripeApi):
 
+    LOOKUP_OPERATION = "get_by_name"
+    LOOKUP_ARGUMENT = "name"
+
     @classmethod
     def __get_product_url_by_name(
             cls,
@@ -161,46 +582,73 @@ class StripeProductApi(StripeApi):
         """
         return f"{name.replace(' ', '')}"
 
+    def _list_lookup_values(self) -> Iterator[str]:
+        for product in self._list_all(self.stripe.Product.list):
+            if product.get("url"):
+                yield product["url"]
+
+    def _lookup_item(
+        self,
+        value: str
+    ) -> str:
+        """
+        Products are found by url, so names with the same url are the same key.
+        """
+        return f"https://{self.__get_product_url_by_name(value)}"
+
+    @write_operation
     def create(
             self,
             name: str
-    ) -> StripeApiProduct:
+    ) -> "StripeApiProduct":
         """
 
         """
-        response = self.stripe.Product.create(
-            name=name,
-            url=f"https://{self.__get_product_url_by_name(name)}"
-        )
+        from stripe_subscription.serializers import StripeApiProduct
+
+        data = {
+            "name": name,
+            "url": self._lookup_item(name)
+        }
+        response = self._create("Product", **data)
         product = StripeApiProduct(**response)
+        self._add_known_key(name)
         return product
 
+    @read_operation
     def get_by_id(
             self,
             product_id: str
-    ) -> StripeApiProduct:
+    ) -> "StripeApiProduct":
         """
 
         """
-        result = self.stripe.Product.retrieve(product_id)
+        from stripe_subscription.serializers import StripeApiProduct
+
+        result = self.stripe.Product.retrieve(product_id, api_key=self.api_key)
         product = StripeApiProduct(**result)
         return product
 
+    @read_operation
     def get_by_name(
             self,
             name: str
-    ) -> Optional[StripeApiProduct]:
+    ) -> Optional["StripeApiProduct"]:
         """
 
         """
+        from stripe_subscription.serializers import StripeApiProduct
+
         result = self.stripe.Product.list(
-            url=f"https://{self.__get_product_url_by_name(name)}"
+            url=f"https://{self.__get_product_url_by_name(name)}",
+            api_key=self.api_key
         )
         if result["data"]:
             customer = StripeApiProduct(**result["data"][0])
             return customer
         return None
 
+    @write_operation
     def delete(
             self,
             product_id: str
@@ -208,19 +656,35 @@ class StripeProductApi(StripeApi):
         """
 
         """
-        response = self.stripe.Product.delete(product_id)
+        response = self.stripe.Product.delete(product_id, api_key=self.api_key)
         return response["deleted"]
 
 
 class StripePriceApi(StripeApi):
 
+    LOOKUP_OPERATION = "get_by_lookup_key"
+    LOOKUP_ARGUMENT = "lookup_key"
+
+    def _list_lookup_values(self) -> Iterator[str]:
+        for price in self._list_all(self.stripe.Price.list):
+            if price.get("lookup_key"):
+                yield price["lookup_key"]
+
+    @write_operation
     def create(
         self,
         amount: int,
-        product: StripeApiProduct,
-        recurring: StripePriceRecurring,
-        currency: StripeCurrencies = StripeCurrencies.usd
-    ) -> StripeApiPrice:
+        product: "StripeApiProduct",
+        recurring: "StripePriceRecurring",
+        currency: Optional["StripeCurrencies"] = None
+    ) -> "StripeApiPrice":
+        """
+        :param currency: StripeCurrencies - usd if None.
+        """
+        from stripe_subscription.serializers import StripeApiPrice, StripeCurrencies
+
+        if currency is None:
+            currency = StripeCurrencies.usd
         data = {
             "lookup_key": product.name,
             "unit_amount": int(amount),
@@ -228,33 +692,41 @@ class StripePriceApi(StripeApi):
             "recurring": recurring.dict(),
             "product": product.id
         }
-        response = self.stripe.Price.create(**data)
+        response = self._create("Price", **data)
         price = StripeApiPrice(**response)
+        self._add_known_key(product.name)
         return price
 
+    @read_operation
     def get_by_lookup_key(
         self,
         lookup_key: str
-    ) -> Optional[StripeApiPrice]:
+    ) -> Optional["StripeApiPrice"]:
         """
         :param lookup_key: It's product name if price was created by this package.
         """
-        result = self.stripe.Price.list(lookup_keys=[lookup_key])
+        from stripe_subscription.serializers import StripeApiPrice
+
+        result = self.stripe.Price.list(lookup_keys=[lookup_key], api_key=self.api_key)
         if result["data"]:
             customer = StripeApiPrice(**result["data"][0])
             return customer
         return None
 
+    @write_operation
     def update_amount(
             self,
             price_id: str,
             new_amount: int,
             product_name: str
-    ) -> StripeApiPrice:
+    ) -> "StripeApiPrice":
+        from stripe_subscription.serializers import StripeApiPrice
+
         response = self.stripe.Price.modify(
             price_id,
             lookup_key=None,
-            active=False
+            active=False,
+            api_key=self.api_key
         )
         new_price_data = {
             "lookup_key": product_name,
@@ -263,51 +735,82 @@ class StripePriceApi(StripeApi):
             "recurring": response["recurring"],
             "product": response["product"]
         }
-        response = self.stripe.Price.create(**new_price_data)
+        response = self.stripe.Price.create(**new_price_data, api_key=self.api_key)
         price = StripeApiPrice(**response)
+        self._add_known_key(product_name)
         return price
 
 
 class StripeSubscriptionApi(StripeApi):
 
+    @write_operation
     def create(
         self,
-        customer: StripeApiCustomer,
-        price: StripeApiPrice
-    ) -> StripeApiSubscription:
+        customer: "StripeApiCustomer",
+        price: "StripeApiPrice"
+    ) -> "StripeApiSubscription":
         """
 
         """
+        from stripe_subscription.serializers import StripeApiSubscription
+
         response = self.stripe.Subscription.create(
             customer=customer.id,
             items=[
                 {"price": price.id},
             ],
+            api_key=self.api_key
         )
         subscription = StripeApiSubscription(**response)
         return subscription
 
+    def list_all(
+            self,
+            status: str = "all",
+            starting_after: Optional[str] = None
+    ) -> Iterator["StripeApiSubscription"]:
+        """
+        Iterates all subscriptions of account page by page.
+        Subscriptions are sorted by created, the newest first.
+        :param status: str - Stripe status filter. "all" includes canceled subscriptions.
+        :param starting_after: str - Subscription id. Iteration starts after it.
+        """
+        from stripe_subscription.serializers import StripeApiSubscription
+
+        params = {"status": status}
+        if starting_after:
+            params["starting_after"] = starting_after
+        for sub in self._list_all(self.stripe.Subscription.list, **params):
+            yield StripeApiSubscription(**sub)
+
+    @read_operation
     def get_customer_subscriptions(
             self,
             customer_id: str
-    ) -> List[StripeApiSubscription]:
+    ) -> List["StripeApiSubscription"]:
+        from stripe_subscription.serializers import StripeApiSubscription
+
         response = self.stripe.Subscription.list(
-            customer = customer_id
+            customer = customer_id,
+            api_key=self.api_key
         )
         return [
             StripeApiSubscription(**sub) for sub in response["data"]
         ]
 
+    @write_operation
     def create_checkout_session(
         self,
         success_url: str,
         cancel_url: str,
-        customer: StripeApiCustomer,
-        price: StripeApiPrice
-    ) -> StripeApiSession:
+        customer: "StripeApiCustomer",
+        price: "StripeApiPrice"
+    ) -> "StripeApiSession":
         """
         Returns StripeApiSession.
         """
+        from stripe_subscription.serializers import StripeApiSession
+
         result = self.stripe.checkout.Session.create(
             success_url=success_url,
             cancel_url=cancel_url,
@@ -319,14 +822,19 @@ class StripeSubscriptionApi(StripeApi):
                     'quantity': 1
                 },
             ],
-            customer=customer.id
+            customer=customer.id,
+            api_key=self.api_key
         )
         serializer = StripeApiSession(**result)
         return serializer
 
-    def retrieve(self, subscription_id: str) -> Optional[StripeApiSubscription]:
+    @read_operation
+    def retrieve(self, subscription_id: str) -> Optional["StripeApiSubscription"]:
+        from stripe_subscription.serializers import StripeApiSubscription
+
         response = self.stripe.Subscription.retrieve(
-            subscription_id
+            subscription_id,
+            api_key=self.api_key
         )
         if not response:
             return None
@@ -0,0 +1,234 @@
+import functools
+import threading
+import time
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Callable, Hashable, Optional
+
+from stripe_subscription.exceptions import CircuitOpenException
+
+
+class CircuitStateEnum(Enum):
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+
+class CircuitBreaker:
+
+    """
+    Circuit breaker for one Stripe endpoint family (Customer, Price, Subscription...).
+
+    Breaker opens when share of failed calls into the sliding window reaches
+    failure_rate_threshold. Call is failed if Stripe is unreachable/broken
+    (see FAILURE_EXCEPTIONS) or if it took longer than slow_call_threshold seconds.
+    While breaker is open:
+        - Reads are served from the last known good response, marked as stale.
+        - Writes fail fast with CircuitOpenException.
+    After reset_timeout only one probe call is let through.
+    Reads which have stale response run the probe in background,
+    so callers never wait for degraded Stripe and only one request hits it.
+    Every breaker has its own probe thread, so probes of different breakers don't queue.
+    """
+
+    # Names of stripe.error exceptions. Resolved on first call, SDK is imported lazily.
+    FAILURE_EXCEPTIONS = (
+        "APIConnectionError",
+        "APIError",
+        "RateLimitError",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        failure_rate_threshold: float = 0.5,
+        slow_call_threshold: float = 5.0,
+        window_size: int = 20,
+        minimum_calls: int = 5,
+        reset_timeout: float = 30.0,
+        cache_size: int = 1000
+    ) -> None:
+        """
+        :param name: str - Endpoint family name. Used in exception messages.
+        :param failure_rate_threshold: float - Share of failed calls (0..1) which opens breaker.
+        :param slow_call_threshold: float - Seconds. Slower calls are counted as failed.
+        :param window_size: int - How many last calls are used to count failure rate.
+        :param minimum_calls: int - Breaker doesn't open until window has so many calls.
+        :param reset_timeout: float - Seconds breaker stays open before probe call.
+        :param cache_size: int - Max count of last known good responses.
+        """
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_threshold = slow_call_threshold
+        self.minimum_calls = minimum_calls
+        self.reset_timeout = reset_timeout
+        self.cache_size = cache_size
+        self._window = deque(maxlen=window_size)
+        self._state = CircuitStateEnum.closed
+        self._opened_at = 0.0
+        self._probing = False
+        self._last_good = OrderedDict()
+        self._lock = threading.Lock()
+
+    @functools.cached_property
+    def failure_exceptions(self) -> tuple:
+        import stripe
+        return tuple(getattr(stripe.error, name) for name in self.FAILURE_EXCEPTIONS)
+
+    @functools.cached_property
+    def executor(self) -> ThreadPoolExecutor:
+        # Only one probe is in flight, so one worker is enough.
+        return ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"circuit-breaker-{self.name}")
+
+    @property
+    def state(self) -> CircuitStateEnum:
+        with self._lock:
+            if (
+                self._state == CircuitStateEnum.open and
+                time.monotonic() - self._opened_at >= self.reset_timeout
+            ):
+                self._state = CircuitStateEnum.half_open
+            return self._state
+
+    def read(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Any],
+        acquire: Optional[Callable[[], Any]] = None
+    ) -> Any:
+        """
+        Calls idempotent fetch() or serves last known good response for key.
+        :param acquire: Callable - Called before request is sent, e.g. RateLimiter.acquire.
+            Its time isn't counted into call duration.
+        """
+        if self.state == CircuitStateEnum.closed:
+            value = self._call(fetch, acquire=acquire)
+            self._remember(key, value)
+            return value
+        has_stale, stale = self._get_stale(key)
+        if self._acquire_probe():
+            if has_stale:
+                self.executor.submit(self._revalidate, key, fetch, acquire)
+                return stale
+            value = self._call(fetch, probe=True, acquire=acquire)
+            self._remember(key, value)
+            return value
+        if has_stale:
+            return stale
+        raise CircuitOpenException(
+            f"Stripe {self.name} API is unavailable and no cached response found"
+        )
+
+    def write(
+        self,
+        fetch: Callable[[], Any],
+        acquire: Optional[Callable[[], Any]] = None
+    ) -> Any:
+        """
+        Calls fetch() or fails fast while breaker is open.
+        :param acquire: Callable - See read.
+        """
+        if self.state == CircuitStateEnum.closed:
+            return self._call(fetch, acquire=acquire)
+        if self._acquire_probe():
+            return self._call(fetch, probe=True, acquire=acquire)
+        raise CircuitOpenException(
+            f"Stripe {self.name} API is unavailable"
+        )
+
+    def _call(
+        self,
+        fetch: Callable[[], Any],
+        probe: bool = False,
+        acquire: Optional[Callable[[], Any]] = None
+    ) -> Any:
+        if acquire is not None:
+            try:
+                acquire()
+            except Exception:
+                # Request wasn't sent, so it's neither success nor failure.
+                if probe:
+                    with self._lock:
+                        self._probing = False
+                raise
+        started = time.monotonic()
+        try:
+            value = fetch()
+        except self.failure_exceptions:
+            self._record(False, probe)
+            raise
+        except Exception:
+            self._record(True, probe)
+            raise
+        self._record(time.monotonic() - started <= self.slow_call_threshold, probe)
+        return value
+
+    def _revalidate(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Any],
+        acquire: Optional[Callable[[], Any]] = None
+    ) -> None:
+        try:
+            value = self._call(fetch, probe=True, acquire=acquire)
+        except Exception:
+            return
+        self._remember(key, value)
+
+    def _record(
+        self,
+        success: bool,
+        probe: bool
+    ) -> None:
+        with self._lock:
+            if probe:
+                self._probing = False
+                if success:
+                    self._state = CircuitStateEnum.closed
+                    self._window.clear()
+                else:
+                    self._state = CircuitStateEnum.open
+                    self._opened_at = time.monotonic()
+                return
+            self._window.append(success)
+            if self._state != CircuitStateEnum.closed or len(self._window) < self.minimum_calls:
+                return
+            failure_rate = self._window.count(False) / len(self._window)
+            if failure_rate >= self.failure_rate_threshold:
+                self._state = CircuitStateEnum.open
+                self._opened_at = time.monotonic()
+
+    def _acquire_probe(self) -> bool:
+        if self.state != CircuitStateEnum.half_open:
+            return False
+        with self._lock:
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def _remember(
+        self,
+        key: Hashable,
+        value: Any
+    ) -> None:
+        with self._lock:
+            self._last_good[key] = value
+            self._last_good.move_to_end(key)
+            if len(self._last_good) > self.cache_size:
+                self._last_good.popitem(last=False)
+
+    def _get_stale(
+        self,
+        key: Hashable
+    ):
+        with self._lock:
+            if key not in self._last_good:
+                return False, None
+            value = self._last_good[key]
+        if isinstance(value, list):
+            return True, [item.as_stale() for item in value]
+        if hasattr(value, "as_stale"):
+            return True, value.as_stale()
+        return True, value
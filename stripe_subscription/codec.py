@@ -0,0 +1,232 @@
+"""
+Compact binary encoding of serializers for caches and inter-process transfer.
+
+Payload is codec version byte and marshal format version byte followed by marshal data:
+    ({model name: field names}, rows)
+marshal format is pinned (MARSHAL_VERSION), so payloads are readable by other Python versions.
+Every model is a tuple of field values in order of its field table,
+so field names are stored once per payload. Datetimes are epoch numbers
+(aware datetimes are wrapped into one item list and restored in UTC),
+enum values are interned strings (marshal stores repeated ones once), other strings are stored as is.
+Decoder maps payload field tables onto current models: unknown fields are dropped,
+missing fields get model defaults. So cached data survives adding/removing optional fields,
+payload without required field raises CodecDecodeException (treat it as cache miss).
+
+marshal is fast but it isn't safe against malicious data. Decoded values are checked
+to be plain data (no code objects), but decode only payloads produced by this package.
+"""
+import datetime
+import enum
+import functools
+import marshal
+import sys
+from typing import Any, Dict, List, Tuple, Type, TypeVar, Union, get_args
+
+from stripe_subscription.exceptions import CodecDecodeException, UnsupportedCodecVersionException
+
+CODEC_VERSION = 2
+
+# marshal format of payload. Version 4 is supported by Python 3.4+.
+MARSHAL_VERSION = 4
+
+_PLAIN_TYPES = (type(None), bool, int, float, str)
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+Model = TypeVar("Model")
+
+_PLAIN = 0
+_DATETIME = 1
+_MODEL = 2
+_MODEL_LIST = 3
+_ENUM = 4
+
+
+@functools.lru_cache(maxsize=None)
+def _field_plan(model_class: type) -> Tuple[Tuple[str, int, Any], ...]:
+    """
+    :returns ((field name, kind, nested model or enum class), ...) in field declaration order.
+    """
+    from pydantic import BaseModel
+    from pydantic.fields import SHAPE_SINGLETON
+
+    plan = []
+    for name, field in model_class.__fields__.items():
+        field_type = field.type_
+        nested = None
+        if isinstance(field_type, type) and issubclass(field_type, BaseModel):
+            nested = field_type
+            kind = _MODEL if field.shape == SHAPE_SINGLETON else _MODEL_LIST
+        elif field_type is datetime.datetime or datetime.datetime in get_args(field_type):
+            kind = _DATETIME
+        elif isinstance(field_type, type) and issubclass(field_type, enum.Enum):
+            nested = field_type
+            kind = _ENUM
+        else:
+            kind = _PLAIN
+        plan.append((name, kind, nested))
+    return tuple(plan)
+
+
+@functools.lru_cache(maxsize=None)
+def _field_kinds(model_class: type) -> Dict[str, Tuple[int, Any]]:
+    return {name: (kind, nested) for name, kind, nested in _field_plan(model_class)}
+
+
+@functools.lru_cache(maxsize=None)
+def _required_fields(model_class: type) -> Tuple[str, ...]:
+    return tuple(name for name, field in model_class.__fields__.items() if field.required)
+
+
+def _check_plain(value: Any) -> Any:
+    if isinstance(value, _PLAIN_TYPES):
+        return value
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            _check_plain(item)
+        return value
+    if isinstance(value, dict):
+        for key, item in value.items():
+            _check_plain(key)
+            _check_plain(item)
+        return value
+    raise CodecDecodeException(f"Unexpected {type(value).__name__} value in payload")
+
+
+def _encode_datetime(value: datetime.datetime) -> Union[int, float, list]:
+    if value.tzinfo is not None:
+        return [_encode_datetime(value.astimezone(datetime.timezone.utc).replace(tzinfo=None))]
+    delta = value - EPOCH
+    if delta.microseconds:
+        return delta.total_seconds()
+    return delta.days * 86400 + delta.seconds
+
+
+def _decode_datetime(value: Union[int, float, list]) -> datetime.datetime:
+    if isinstance(value, list):
+        return _decode_datetime(value[0]).replace(tzinfo=datetime.timezone.utc)
+    return EPOCH + datetime.timedelta(seconds=value)
+
+
+def _encode_model(
+    model,
+    tables: Dict[str, tuple]
+) -> tuple:
+    model_class = type(model)
+    plan = _field_plan(model_class)
+    if model_class.__name__ not in tables:
+        tables[model_class.__name__] = tuple(name for name, kind, nested in plan)
+    row = []
+    for name, kind, nested in plan:
+        value = getattr(model, name)
+        if value is None:
+            pass
+        elif kind == _DATETIME:
+            if isinstance(value, datetime.datetime):
+                value = _encode_datetime(value)
+        elif kind == _MODEL:
+            value = _encode_model(value, tables)
+        elif kind == _MODEL_LIST:
+            value = [_encode_model(item, tables) for item in value]
+        elif kind == _ENUM:
+            value = sys.intern(value.value if isinstance(value, enum.Enum) else value)
+        row.append(value)
+    return tuple(row)
+
+
+def _decode_model(
+    model_class: Type[Model],
+    row: tuple,
+    tables: Dict[str, tuple]
+) -> Model:
+    plan = _field_kinds(model_class)
+    use_enum_values = model_class.__config__.use_enum_values
+    values = {}
+    for name, value in zip(tables[model_class.__name__], row):
+        if name not in plan:
+            continue
+        kind, nested = plan[name]
+        if value is None:
+            pass
+        elif kind == _PLAIN:
+            _check_plain(value)
+        elif kind == _DATETIME:
+            value = _decode_datetime(value)
+        elif kind == _MODEL:
+            value = _decode_model(nested, value, tables)
+        elif kind == _MODEL_LIST:
+            value = [_decode_model(nested, item, tables) for item in value]
+        elif kind == _ENUM and not use_enum_values:
+            value = nested(value)
+        values[name] = value
+    for name in _required_fields(model_class):
+        if name not in values:
+            raise CodecDecodeException(
+                f"Payload has no required field {model_class.__name__}.{name}"
+            )
+    return model_class.construct(**values)
+
+
+def encode_many(models: List) -> bytes:
+    """
+    Encodes list of serializers of the same class.
+    """
+    tables = {}
+    rows = [_encode_model(model, tables) for model in models]
+    return bytes([CODEC_VERSION, MARSHAL_VERSION]) + marshal.dumps((tables, rows), MARSHAL_VERSION)
+
+
+def _load_payload(data: bytes) -> Tuple[dict, list]:
+    if not data:
+        raise CodecDecodeException("Payload is empty")
+    if data[0] > CODEC_VERSION:
+        raise UnsupportedCodecVersionException(
+            f"Codec version {data[0]} is newer than supported {CODEC_VERSION}"
+        )
+    # Version 1 payloads have no marshal version byte, they were written with marshal version 4.
+    marshal_version, body = (4, data[1:]) if data[0] == 1 else (data[1], data[2:])
+    if marshal_version > marshal.version:
+        raise UnsupportedCodecVersionException(
+            f"marshal version {marshal_version} is newer than supported {marshal.version}"
+        )
+    try:
+        tables, rows = marshal.loads(body)
+    except (EOFError, ValueError, TypeError) as error:
+        raise CodecDecodeException(f"Payload is corrupted: {error}") from error
+    if not isinstance(tables, dict) or not isinstance(rows, list):
+        raise CodecDecodeException("Payload is corrupted")
+    for model_name, field_names in tables.items():
+        if not isinstance(field_names, tuple) or not all(
+            isinstance(name, str) for name in field_names
+        ):
+            raise CodecDecodeException(f"Field table of {model_name} is corrupted")
+    return tables, rows
+
+
+def decode_many(
+    data: bytes,
+    model_class: Type[Model]
+) -> List[Model]:
+    """
+    Decodes result of encode_many. Models are built without validation.
+    """
+    tables, rows = _load_payload(data)
+    if model_class.__name__ not in tables:
+        if rows:
+            raise CodecDecodeException(f"Payload has no {model_class.__name__} rows")
+        return []
+    try:
+        return [_decode_model(model_class, row, tables) for row in rows]
+    except (KeyError, TypeError, ValueError) as error:
+        raise CodecDecodeException(f"Payload is corrupted: {error}") from error
+
+
+def encode(model) -> bytes:
+    return encode_many([model])
+
+
+def decode(
+    data: bytes,
+    model_class: Type[Model]
+) -> Model:
+    return decode_many(data, model_class)[0]
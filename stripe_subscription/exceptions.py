@@ -4,3 +4,23 @@ class StripeApiCustomException(Exception):
 
 class ActiveSubscriptionFoundException(StripeApiCustomException):
     pass
+
+
+class CircuitOpenException(StripeApiCustomException):
+    pass
+
+
+class UnsupportedCodecVersionException(StripeApiCustomException):
+    pass
+
+
+class CodecDecodeException(StripeApiCustomException):
+    pass
+
+
+class RateLimitExceededException(StripeApiCustomException):
+    pass
+
+
+class UnsortedRecordsException(StripeApiCustomException):
+    pass
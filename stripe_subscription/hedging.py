@@ -0,0 +1,217 @@
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Optional
+
+from stripe_subscription.profiling import merge_thread_sample, thread_context
+
+
+class LatencyTracker:
+
+    """
+    Keeps last latencies of every endpoint and returns their percentiles.
+    """
+
+    def __init__(
+        self,
+        window_size: int = 200
+    ) -> None:
+        """
+        :param window_size: int - How many last latencies are kept per endpoint.
+        """
+        self.window_size = window_size
+        self._latencies: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        endpoint: str,
+        latency: float
+    ) -> None:
+        with self._lock:
+            window = self._latencies.get(endpoint)
+            if window is None:
+                window = self._latencies[endpoint] = deque(maxlen=self.window_size)
+            window.append(latency)
+
+    def percentile(
+        self,
+        endpoint: str,
+        percentile: float,
+        minimum_samples: int = 1
+    ) -> Optional[float]:
+        """
+        :param percentile: float - 0..1
+        :returns None if endpoint has less than minimum_samples latencies.
+        """
+        with self._lock:
+            window = self._latencies.get(endpoint)
+            if not window or len(window) < minimum_samples:
+                return None
+            latencies = sorted(window)
+        index = min(int(percentile * len(latencies)), len(latencies) - 1)
+        return latencies[index]
+
+
+class RequestHedger:
+
+    """
+    Hedging for idempotent reads.
+    If response hasn't arrived after delay, duplicate request is sent
+    and the first response wins.
+    Delay is percentile of endpoint latencies (see LatencyTracker).
+    Count of hedged requests is limited by global budget:
+    every request earns budget_ratio tokens, every hedge costs one token.
+    So with budget_ratio=0.05 hedges add at most 5% of requests.
+    The first request is started at once on its own thread, so it never waits for pool
+    and count of reads in flight isn't limited. Duplicates are sent by hedger's own pool
+    of max_hedges_in_flight threads, hedge is skipped if all of them are busy.
+    Latencies and delay are both counted from the moment request is started.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        default_delay: float = 1.0,
+        min_delay: float = 0.01,
+        minimum_samples: int = 20,
+        budget_ratio: float = 0.05,
+        max_budget: float = 10.0,
+        max_hedges_in_flight: int = 4,
+        latency_tracker: Optional[LatencyTracker] = None
+    ) -> None:
+        """
+        :param percentile: float - Latency percentile (0..1) used as hedge delay.
+        :param default_delay: float - Seconds. Delay until endpoint has minimum_samples latencies.
+        :param min_delay: float - Seconds. Hedge delay is never less than this.
+        :param minimum_samples: int - Latencies needed to use percentile delay.
+        :param budget_ratio: float - Max share of extra requests.
+        :param max_budget: float - Max hedges which can be sent in a row.
+        :param max_hedges_in_flight: int - Threads of hedger's pool for duplicate requests.
+        :param latency_tracker: LatencyTracker - Shared tracker. New one is created if None.
+        """
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.minimum_samples = minimum_samples
+        self.budget_ratio = budget_ratio
+        self.max_budget = max_budget
+        self.max_hedges_in_flight = max_hedges_in_flight
+        self.latency_tracker = latency_tracker or LatencyTracker()
+        self.requests_count = 0
+        self.hedges_count = 0
+        self._budget = 0.0
+        self._hedge_slots = threading.BoundedSemaphore(max_hedges_in_flight)
+        self._lock = threading.Lock()
+
+    @functools.cached_property
+    def executor(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(
+            max_workers=self.max_hedges_in_flight, thread_name_prefix="request-hedger"
+        )
+
+    def delay(
+        self,
+        endpoint: str
+    ) -> float:
+        """
+        Seconds to wait for response before hedge request.
+        """
+        delay = self.latency_tracker.percentile(
+            endpoint, self.percentile, self.minimum_samples
+        )
+        if delay is None:
+            delay = self.default_delay
+        return max(delay, self.min_delay)
+
+    def call(
+        self,
+        endpoint: str,
+        fetch: Callable[[], Any],
+        can_hedge: Optional[Callable[[], bool]] = None
+    ) -> Any:
+        """
+        Calls fetch() and hedges it if response is late.
+        Exception is raised only if all sent requests failed.
+        :param can_hedge: Callable - Called before hedge, e.g. RateLimiter.try_acquire.
+            Hedge is skipped if it returns False.
+        """
+        with self._lock:
+            self.requests_count += 1
+            self._budget = min(self._budget + self.budget_ratio, self.max_budget)
+        # Profiling samples of requests, only the used response is counted.
+        samples = {}
+        pending = {self._start(endpoint, fetch, samples)}
+        done, pending = wait(pending, timeout=self.delay(endpoint))
+        if not done and self._take_hedge_slot(can_hedge):
+            pending.add(self._hedge(endpoint, fetch, samples))
+        error = None
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    merge_thread_sample(samples[future])
+                    return future.result()
+                error = future.exception()
+            if not pending:
+                raise error
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+    def _start(
+        self,
+        endpoint: str,
+        fetch: Callable[[], Any],
+        samples: dict
+    ) -> Future:
+        future = Future()
+        context, samples[future] = thread_context()
+        thread = threading.Thread(
+            target=context.run,
+            args=(self._run, future, endpoint, fetch, time.monotonic()),
+            name="request-hedger-request",
+            daemon=True
+        )
+        thread.start()
+        return future
+
+    def _hedge(
+        self,
+        endpoint: str,
+        fetch: Callable[[], Any],
+        samples: dict
+    ) -> Future:
+        future = Future()
+        future.add_done_callback(lambda _: self._hedge_slots.release())
+        context, samples[future] = thread_context()
+        self.executor.submit(context.run, self._run, future, endpoint, fetch, time.monotonic())
+        return future
+
+    def _take_hedge_slot(
+        self,
+        can_hedge: Optional[Callable[[], bool]] = None
+    ) -> bool:
+        if not self._hedge_slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            if self._budget >= 1 and (can_hedge is None or can_hedge()):
+                self._budget -= 1
+                self.hedges_count += 1
+                return True
+        self._hedge_slots.release()
+        return False
+
+    def _run(
+        self,
+        future: Future,
+        endpoint: str,
+        fetch: Callable[[], Any],
+        started: float
+    ) -> None:
+        try:
+            value = fetch()
+        except BaseException as error:
+            future.set_exception(error)
+            return
+        self.latency_tracker.add(endpoint, time.monotonic() - started)
+        future.set_result(value)
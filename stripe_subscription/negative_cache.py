@@ -0,0 +1,109 @@
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+
+class NegativeCache:
+
+    """
+    Short living cache of lookups which returned nothing.
+    Entry expires after ttl seconds, so objects created by other processes
+    become visible quickly.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 10.0,
+        max_size: int = 10000
+    ) -> None:
+        """
+        :param ttl: float - Seconds entry lives.
+        :param max_size: int - Max count of entries. The oldest are dropped.
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._expires = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        key: Hashable
+    ) -> None:
+        with self._lock:
+            self._expires[key] = time.monotonic() + self.ttl
+            self._expires.move_to_end(key)
+            if len(self._expires) > self.max_size:
+                self._expires.popitem(last=False)
+
+    def discard(
+        self,
+        key: Hashable
+    ) -> None:
+        with self._lock:
+            self._expires.pop(key, None)
+
+    def __contains__(
+        self,
+        key: Hashable
+    ) -> bool:
+        with self._lock:
+            expires = self._expires.get(key)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._expires[key]
+                return False
+            return True
+
+
+class BloomFilter:
+
+    """
+    Set of strings without false negatives.
+    If item is not in filter it was never added,
+    if item is in filter it was added with error_rate probability of mistake.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 100000,
+        error_rate: float = 0.01
+    ) -> None:
+        """
+        :param capacity: int - Expected count of items.
+        :param error_rate: float - False positive probability at capacity.
+        """
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _positions(
+        self,
+        item: str
+    ):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (first + i * second) % self.size
+
+    def add(
+        self,
+        item: str
+    ) -> None:
+        with self._lock:
+            for position in self._positions(item):
+                self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(
+        self,
+        item: str
+    ) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
@@ -0,0 +1,329 @@
+"""
+Sampled profiling of StripeSubscriptionService operations.
+
+Every sampled operation gets wall and CPU time split into phases:
+    network - time into Stripe SDK calls (HTTP request and SDK response decoding),
+    parse - rest of API client time (serializers validation),
+    logic - rest of operation time (service business logic).
+Optionally tracemalloc allocation diff is taken for the operation.
+Not sampled operations cost one random() call.
+Requests made on other threads (hedging) are counted only if their response is used.
+Profiler errors are logged and never reach the caller.
+"""
+import contextvars
+import functools
+import random
+import threading
+import time
+import types
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+_current_sample = contextvars.ContextVar("stripe_subscription_profile_sample", default=None)
+
+NETWORK = "network"
+CLIENT = "client"
+
+
+# tracemalloc is process wide, it's started by the first traced operation
+# and stopped when the last one is finished.
+_tracing_lock = threading.Lock()
+_tracing_operations = 0
+_tracing_started = False
+
+
+def _start_tracing() -> None:
+    global _tracing_operations, _tracing_started
+    import tracemalloc
+
+    with _tracing_lock:
+        if _tracing_operations == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracing_started = True
+        _tracing_operations += 1
+
+
+def _stop_tracing() -> None:
+    global _tracing_operations, _tracing_started
+    import tracemalloc
+
+    with _tracing_lock:
+        _tracing_operations -= 1
+        # Tracing started by application isn't stopped.
+        if _tracing_operations == 0 and _tracing_started:
+            tracemalloc.stop()
+            _tracing_started = False
+
+
+def _log_error(message: str) -> None:
+    import logging
+
+    logging.getLogger(__name__).exception(message)
+
+
+class OperationSample:
+
+    def __init__(
+        self,
+        operation: str
+    ) -> None:
+        self.operation = operation
+        self.wall = 0.0
+        self.cpu = 0.0
+        # {"network": [wall, cpu], "client": [wall, cpu]}, client time includes network.
+        self.raw_phases: Dict[str, List[float]] = {}
+        self.allocations: List[str] = []
+        # CPU time of requests made on other threads, see merge().
+        self.other_threads_cpu = 0.0
+        self._lock = threading.Lock()
+
+    def add_phase(
+        self,
+        phase: str,
+        wall: float,
+        cpu: float
+    ) -> None:
+        with self._lock:
+            timings = self.raw_phases.setdefault(phase, [0.0, 0.0])
+            timings[0] += wall
+            timings[1] += cpu
+
+    def merge(
+        self,
+        thread_sample: "OperationSample"
+    ) -> None:
+        """
+        Adds phases of request made on other thread (see thread_context).
+        Request is wholly inside client phase, so its client CPU time is CPU time of that thread.
+        """
+        with thread_sample._lock:
+            phases = {phase: list(timings) for phase, timings in thread_sample.raw_phases.items()}
+        for phase, (wall, cpu) in phases.items():
+            self.add_phase(phase, wall, cpu)
+        with self._lock:
+            self.other_threads_cpu += phases.get(CLIENT, [0.0, 0.0])[1]
+
+    def phases(self, metric: str = "wall") -> Dict[str, float]:
+        """
+        :param metric: str - "wall" or "cpu"
+        :returns {"network": seconds, "parse": seconds, "logic": seconds}
+        """
+        position = 0 if metric == "wall" else 1
+        total = self.wall if metric == "wall" else self.cpu
+        network = self.raw_phases.get(NETWORK, [0.0, 0.0])[position]
+        client = self.raw_phases.get(CLIENT, [0.0, 0.0])[position]
+        return {
+            "network": network,
+            "parse": max(client - network, 0.0),
+            "logic": max(total - client, 0.0)
+        }
+
+
+def profile_phase(
+    phase: str,
+    func: Callable,
+    *args,
+    **kwargs
+) -> Any:
+    """
+    Calls func and adds its time to the phase of current sampled operation, if any.
+    """
+    sample = _current_sample.get()
+    if sample is None:
+        return func(*args, **kwargs)
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        sample.add_phase(phase, time.perf_counter() - wall, time.thread_time() - cpu)
+
+
+def thread_context() -> Tuple[contextvars.Context, Optional[OperationSample]]:
+    """
+    Context for request made on other thread for current operation (e.g. hedged request).
+    Request timings go into returned sample, it's merged into operation by merge_thread_sample()
+    only if response is used. Sample is None if operation isn't sampled.
+    """
+    context = contextvars.copy_context()
+    sample = _current_sample.get()
+    if sample is None:
+        return context, None
+    thread_sample = OperationSample(operation=sample.operation)
+    context.run(_current_sample.set, thread_sample)
+    return context, thread_sample
+
+
+def merge_thread_sample(thread_sample: Optional[OperationSample]) -> None:
+    sample = _current_sample.get()
+    if sample is None or thread_sample is None:
+        return
+    try:
+        sample.merge(thread_sample)
+    except Exception:
+        _log_error("Thread sample isn't merged")
+
+
+class NetworkTimer:
+
+    """
+    Proxy of stripe module for StripeApi.stripe.
+    Calls like stripe.Customer.list(...) are counted into network phase.
+    """
+
+    def __init__(self, target) -> None:
+        self._target = target
+
+    def __getattr__(self, name: str):
+        value = getattr(self._target, name)
+        if isinstance(value, (types.ModuleType, type)):
+            return NetworkTimer(value)
+        if callable(value):
+            return functools.partial(profile_phase, NETWORK, value)
+        return value
+
+
+class OperationProfiler:
+
+    """
+    Collects samples of operations.
+    Example:
+        service = StripeSubscriptionService(api_key, profiling_options={"sample_rate": 0.01})
+        ...
+        service.profiler.dump_collapsed("stripe.folded")  # flamegraph.pl stripe.folded > stripe.svg
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = 0.01,
+        trace_allocations: bool = False,
+        max_samples: int = 10000,
+        top_allocations: int = 10
+    ) -> None:
+        """
+        :param sample_rate: float - Share of profiled operations (0..1).
+        :param trace_allocations: bool - Takes tracemalloc diff for sampled operations.
+            Allocations of other threads made at the same time are included.
+        :param max_samples: int - Only the last samples are kept.
+        :param top_allocations: int - Count of the biggest allocation lines kept per sample.
+        """
+        self.sample_rate = sample_rate
+        self.trace_allocations = trace_allocations
+        self.top_allocations = top_allocations
+        self.samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def run(
+        self,
+        operation: str,
+        func: Callable,
+        *args,
+        **kwargs
+    ) -> Any:
+        """
+        Calls func as operation, profiles it with sample_rate probability.
+        Operations called by sampled operation are part of it.
+        """
+        if _current_sample.get() is not None or random.random() >= self.sample_rate:
+            return func(*args, **kwargs)
+        sample = OperationSample(operation=operation)
+        token = _current_sample.set(sample)
+        snapshot = self._take_first_snapshot()
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sample.wall = time.perf_counter() - wall
+            sample.cpu = time.thread_time() - cpu + sample.other_threads_cpu
+            _current_sample.reset(token)
+            self._finish(sample, snapshot)
+
+    def _take_first_snapshot(self):
+        if not self.trace_allocations:
+            return None
+        try:
+            _start_tracing()
+        except Exception:
+            _log_error("tracemalloc isn't started")
+            return None
+        try:
+            import tracemalloc
+
+            return tracemalloc.take_snapshot()
+        except Exception:
+            _stop_tracing()
+            _log_error("tracemalloc snapshot isn't taken")
+            return None
+
+    def _finish(
+        self,
+        sample: OperationSample,
+        snapshot
+    ) -> None:
+        try:
+            if snapshot is not None:
+                try:
+                    import tracemalloc
+
+                    statistics = tracemalloc.take_snapshot().compare_to(snapshot, "lineno")
+                    sample.allocations = [str(stat) for stat in statistics[:self.top_allocations]]
+                finally:
+                    _stop_tracing()
+            with self._lock:
+                self.samples.append(sample)
+        except Exception:
+            _log_error(f"Sample of {sample.operation} isn't saved")
+
+    def summary(self, metric: str = "wall") -> Dict[str, dict]:
+        """
+        :returns {operation: {"count": int, "total": avg seconds, phase: avg seconds}}
+        """
+        with self._lock:
+            samples = list(self.samples)
+        result = {}
+        for sample in samples:
+            item = result.setdefault(
+                sample.operation,
+                {"count": 0, "total": 0.0, "network": 0.0, "parse": 0.0, "logic": 0.0}
+            )
+            item["count"] += 1
+            item["total"] += sample.wall if metric == "wall" else sample.cpu
+            for phase, value in sample.phases(metric).items():
+                item[phase] += value
+        for item in result.values():
+            for key in ("total", "network", "parse", "logic"):
+                item[key] /= item["count"]
+        return result
+
+    def collapsed_stacks(self, metric: str = "wall") -> str:
+        """
+        Returns samples in collapsed stack format of flamegraph.pl/speedscope:
+            "operation;phase microseconds" per line.
+        """
+        with self._lock:
+            samples = list(self.samples)
+        stacks = {}
+        for sample in samples:
+            for phase, value in sample.phases(metric).items():
+                stack = f"{sample.operation};{phase}"
+                stacks[stack] = stacks.get(stack, 0) + int(value * 1_000_000)
+        return "\n".join(f"{stack} {value}" for stack, value in sorted(stacks.items()) if value)
+
+    def dump_collapsed(
+        self,
+        path: str,
+        metric: str = "wall"
+    ) -> None:
+        with open(path, "w") as file:
+            file.write(self.collapsed_stacks(metric) + "\n")
+
+
+def profiled_operation(method):
+    """
+    Marks service method as profiled operation. Service must have `profiler` attribute.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.profiler is None:
+            return method(self, *args, **kwargs)
+        return self.profiler.run(method.__name__, method, self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,64 @@
+import threading
+import time
+from typing import Optional
+
+from stripe_subscription.exceptions import RateLimitExceededException
+
+
+class RateLimiter:
+
+    """
+    Token bucket limiting requests rate of one Stripe account.
+    Stripe limits requests per account, so every tenant has its own limiter.
+    """
+
+    def __init__(
+        self,
+        rate: float = 25.0,
+        burst: Optional[float] = None,
+        max_wait: float = 5.0
+    ) -> None:
+        """
+        :param rate: float - Requests per second.
+        :param burst: float - Max requests sent without waiting. Equals rate if None.
+        :param max_wait: float - Seconds. Max time request waits for a token.
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.max_wait = max_wait
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Takes one token, waits if bucket is empty.
+        Raises RateLimitExceededException if token isn't available within max_wait.
+        """
+        with self._lock:
+            self._refill()
+            wait = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+            if wait > self.max_wait:
+                raise RateLimitExceededException(
+                    f"Request rate is over {self.rate} per second"
+                )
+            # Token is reserved now, so concurrent callers wait in turn.
+            self._tokens -= 1
+        if wait:
+            time.sleep(wait)
+
+    def try_acquire(self) -> bool:
+        """
+        Takes one token if it's available at once, never waits.
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
@@ -0,0 +1,212 @@
+import datetime
+import itertools
+import time
+from enum import Enum
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from stripe_subscription.base_api import StripeSubscriptionApi
+from stripe_subscription.exceptions import UnsortedRecordsException
+from stripe_subscription.serializers import StripeApiSubscription
+
+
+class LocalSubscriptionRecord(BaseModel):
+    """
+    Subscription from local store. Datetimes are naive UTC like into serializers.
+    """
+    id: str
+    customer: str = None
+    status: str
+    created: datetime.datetime
+    current_period_end: datetime.datetime = None
+    price_ids: List[str] = []
+
+
+class SubscriptionDiffTypeEnum(Enum):
+    missing_locally = "missing_locally"
+    missing_in_stripe = "missing_in_stripe"
+    status_mismatch = "status_mismatch"
+    period_mismatch = "period_mismatch"
+    price_mismatch = "price_mismatch"
+
+
+class SubscriptionDiff(BaseModel):
+    type: SubscriptionDiffTypeEnum
+    subscription_id: str
+    local: LocalSubscriptionRecord = None
+    stripe: StripeApiSubscription = None
+    local_value: Any = None
+    stripe_value: Any = None
+
+
+class ReconciliationCursor(BaseModel):
+    """
+    Position of reconciliation. All subscriptions created at or after `created` are processed.
+    """
+    created: datetime.datetime
+    stripe_starting_after: str = None
+
+
+class ReconciliationStats(BaseModel):
+    stripe_count: int = 0
+    local_count: int = 0
+    diffs_count: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def records_per_second(self) -> float:
+        if not self.elapsed:
+            return 0.0
+        return (self.stripe_count + self.local_count) / self.elapsed
+
+
+class SubscriptionReconciler:
+
+    """
+    Compares local subscriptions with Stripe in one pass with constant memory.
+    Stripe can't sort subscriptions by id, its lists are sorted by created (the newest first).
+    So both sides are merged by created and subscriptions created at the same second
+    are matched by id. Local records must be sorted by created descending too.
+    reconciler.cursor saved after handling a diff resumes right after it
+    (diffs of an interrupted same-second group are repeated).
+    Example:
+        reconciler = SubscriptionReconciler(service.subscription_api)
+        cursor = load_cursor()
+        local = local_records(created_before=cursor and cursor.created)
+        for diff in reconciler.diff(local, cursor=cursor):
+            handle(diff)
+            save(reconciler.cursor)
+    """
+
+    def __init__(
+        self,
+        subscription_api: StripeSubscriptionApi
+    ) -> None:
+        self.subscription_api = subscription_api
+        self.cursor: Optional[ReconciliationCursor] = None
+        self.stats = ReconciliationStats()
+
+    def diff(
+        self,
+        local_records: Iterable[LocalSubscriptionRecord],
+        cursor: Optional[ReconciliationCursor] = None
+    ) -> Iterator[SubscriptionDiff]:
+        """
+        :param local_records: Local subscriptions sorted by created descending.
+        :param cursor: ReconciliationCursor - Resumes previous reconciliation.
+            Local records created at or after cursor.created are skipped.
+        """
+        self.cursor = cursor
+        self.stats = ReconciliationStats()
+        started = time.monotonic()
+        stripe_records = self.subscription_api.list_all(
+            starting_after=cursor.stripe_starting_after if cursor else None
+        )
+        local_records = self._checked(local_records, cursor)
+        stripe_groups = self._groups(stripe_records)
+        local_groups = self._groups(local_records)
+        stripe_group = next(stripe_groups, None)
+        local_group = next(local_groups, None)
+        stripe_starting_after = cursor.stripe_starting_after if cursor else None
+        while stripe_group or local_group:
+            if local_group is None or (stripe_group and stripe_group[0] > local_group[0]):
+                created = stripe_group[0]
+                diffs = self._compare_group(stripe_group[1], [])
+            elif stripe_group is None or local_group[0] > stripe_group[0]:
+                created = local_group[0]
+                diffs = self._compare_group([], local_group[1])
+            else:
+                created = stripe_group[0]
+                diffs = self._compare_group(stripe_group[1], local_group[1])
+            diffs = list(diffs)
+            if stripe_group and stripe_group[0] == created:
+                self.stats.stripe_count += len(stripe_group[1])
+                stripe_starting_after = stripe_group[1][-1].id
+                stripe_group = next(stripe_groups, None)
+            if local_group and local_group[0] == created:
+                self.stats.local_count += len(local_group[1])
+                local_group = next(local_groups, None)
+            next_cursor = ReconciliationCursor(
+                created=created,
+                stripe_starting_after=stripe_starting_after
+            )
+            for number, diff in enumerate(diffs, 1):
+                self.stats.diffs_count += 1
+                if number == len(diffs):
+                    # Group is done after its last diff is handled.
+                    self.cursor = next_cursor
+                self.stats.elapsed = time.monotonic() - started
+                yield diff
+            self.cursor = next_cursor
+            self.stats.elapsed = time.monotonic() - started
+
+    @staticmethod
+    def _checked(
+        records: Iterable[LocalSubscriptionRecord],
+        cursor: Optional[ReconciliationCursor]
+    ) -> Iterator[LocalSubscriptionRecord]:
+        previous = None
+        for record in records:
+            if previous is not None and record.created > previous:
+                raise UnsortedRecordsException(
+                    f"Local subscription {record.id} breaks created descending order"
+                )
+            previous = record.created
+            if cursor is not None and record.created >= cursor.created:
+                continue
+            yield record
+
+    @staticmethod
+    def _groups(records: Iterable) -> Iterator[Tuple[datetime.datetime, list]]:
+        for created, group in itertools.groupby(records, key=lambda record: record.created):
+            yield created, list(group)
+
+    @staticmethod
+    def _compare_group(
+        stripe_records: List[StripeApiSubscription],
+        local_records: List[LocalSubscriptionRecord]
+    ) -> Iterator[SubscriptionDiff]:
+        local_by_id = {record.id: record for record in local_records}
+        for stripe_record in stripe_records:
+            local = local_by_id.pop(stripe_record.id, None)
+            if local is None:
+                yield SubscriptionDiff(
+                    type=SubscriptionDiffTypeEnum.missing_locally,
+                    subscription_id=stripe_record.id,
+                    stripe=stripe_record
+                )
+                continue
+            yield from SubscriptionReconciler._compare(stripe_record, local)
+        for local in local_by_id.values():
+            yield SubscriptionDiff(
+                type=SubscriptionDiffTypeEnum.missing_in_stripe,
+                subscription_id=local.id,
+                local=local
+            )
+
+    @staticmethod
+    def _compare(
+        stripe_record: StripeApiSubscription,
+        local: LocalSubscriptionRecord
+    ) -> Iterator[SubscriptionDiff]:
+        stripe_price_ids = sorted(item.price.id for item in stripe_record.items)
+        checks = (
+            (SubscriptionDiffTypeEnum.status_mismatch, local.status, stripe_record.status),
+            (
+                SubscriptionDiffTypeEnum.period_mismatch,
+                local.current_period_end,
+                stripe_record.current_period_end
+            ),
+            (SubscriptionDiffTypeEnum.price_mismatch, sorted(local.price_ids), stripe_price_ids),
+        )
+        for diff_type, local_value, stripe_value in checks:
+            if local_value != stripe_value:
+                yield SubscriptionDiff(
+                    type=diff_type,
+                    subscription_id=stripe_record.id,
+                    local=local,
+                    stripe=stripe_record,
+                    local_value=local_value,
+                    stripe_value=stripe_value
+                )
@@ -0,0 +1,316 @@
+import datetime
+import heapq
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from stripe_subscription.serializers import StripeApiSubscription
+
+
+class SubscriptionIndex:
+
+    """
+    Subscriptions ordered by timestamp field (current_period_end, canceled_at, ended_at...)
+    plus offset. Backed by heap, so:
+        - update() is O(log n),
+        - due() and upcoming() are O(k log k) for k returned subscriptions,
+        - mark_fired() is O(log n).
+    Subscription is due once per timestamp value: after mark_fired() it's due again
+    only when it's updated with another timestamp (e.g. next period).
+    Subscriptions due more than max_lateness before the last due() call are dropped
+    without firing, so old canceled/ended subscriptions don't fire and fired marks are pruned.
+    Datetimes are naive UTC like into serializers.
+    """
+
+    def __init__(
+        self,
+        field: str = "current_period_end",
+        offset: datetime.timedelta = datetime.timedelta(),
+        statuses: Optional[Iterable[str]] = None,
+        max_lateness: Optional[datetime.timedelta] = datetime.timedelta(days=30)
+    ) -> None:
+        """
+        :param field: str - Datetime field of StripeApiSubscription.
+        :param offset: timedelta - Added to field value, e.g. -3 days for renewal reminder.
+        :param statuses: Only subscriptions with these statuses are indexed. All if None.
+        :param max_lateness: timedelta - Max delay of firing. Not limited if None.
+        """
+        self.field = field
+        self.offset = offset
+        self.statuses = set(statuses) if statuses is not None else None
+        self.max_lateness = max_lateness
+        self._heap: List[Tuple[datetime.datetime, str]] = []
+        self._due_at: Dict[str, datetime.datetime] = {}
+        self._subscriptions: Dict[str, StripeApiSubscription] = {}
+        self._fired_at: Dict[str, datetime.datetime] = {}
+        self._fired_heap: List[Tuple[datetime.datetime, str]] = []
+        self._now: Optional[datetime.datetime] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._due_at)
+
+    def _key(
+        self,
+        subscription: StripeApiSubscription
+    ) -> Optional[datetime.datetime]:
+        if self.statuses is not None and subscription.status not in self.statuses:
+            return None
+        value = getattr(subscription, self.field)
+        if value is None:
+            return None
+        return value + self.offset
+
+    def update(
+        self,
+        subscription: StripeApiSubscription
+    ) -> None:
+        """
+        Adds subscription or replaces its previous version.
+        """
+        due_at = self._key(subscription)
+        with self._lock:
+            if (
+                due_at is None or
+                self._fired_at.get(subscription.id) == due_at or
+                self._is_expired(due_at)
+            ):
+                self._remove(subscription.id)
+                return
+            self._fired_at.pop(subscription.id, None)
+            self._subscriptions[subscription.id] = subscription
+            if self._due_at.get(subscription.id) != due_at:
+                self._due_at[subscription.id] = due_at
+                heapq.heappush(self._heap, (due_at, subscription.id))
+                self._compact_if_sparse()
+
+    def update_many(
+        self,
+        subscriptions: Iterable[StripeApiSubscription]
+    ) -> None:
+        for subscription in subscriptions:
+            self.update(subscription)
+
+    def remove(
+        self,
+        subscription_id: str
+    ) -> None:
+        with self._lock:
+            self._remove(subscription_id)
+
+    def _remove(
+        self,
+        subscription_id: str
+    ) -> None:
+        # Heap item is left and skipped when popped.
+        self._due_at.pop(subscription_id, None)
+        self._subscriptions.pop(subscription_id, None)
+
+    def _compact_if_sparse(self) -> None:
+        """
+        Drops heap items of removed, updated and fired subscriptions.
+        """
+        if len(self._heap) <= 2 * len(self._due_at) + 64:
+            return
+        self._heap = [(due_at, subscription_id) for subscription_id, due_at in self._due_at.items()]
+        heapq.heapify(self._heap)
+
+    def _is_expired(
+        self,
+        due_at: datetime.datetime
+    ) -> bool:
+        return (
+            self.max_lateness is not None and
+            self._now is not None and
+            due_at < self._now - self.max_lateness
+        )
+
+    def _prune(
+        self,
+        now: datetime.datetime
+    ) -> None:
+        """
+        Drops subscriptions and fired marks older than max_lateness.
+        """
+        if self._now is None or now > self._now:
+            self._now = now
+        while self._heap and (
+            not self._is_actual(*self._heap[0]) or self._is_expired(self._heap[0][0])
+        ):
+            due_at, subscription_id = heapq.heappop(self._heap)
+            if self._is_actual(due_at, subscription_id):
+                self._remove(subscription_id)
+        while self._fired_heap and self._is_expired(self._fired_heap[0][0]):
+            due_at, subscription_id = heapq.heappop(self._fired_heap)
+            if self._fired_at.get(subscription_id) == due_at:
+                del self._fired_at[subscription_id]
+
+    def _is_actual(
+        self,
+        due_at: datetime.datetime,
+        subscription_id: str
+    ) -> bool:
+        return self._due_at.get(subscription_id) == due_at
+
+    def next_due_at(self) -> Optional[datetime.datetime]:
+        """
+        Time of the earliest subscription, None if index is empty.
+        """
+        with self._lock:
+            while self._heap and not self._is_actual(*self._heap[0]):
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def due(
+        self,
+        now: Optional[datetime.datetime] = None
+    ) -> List[Tuple[datetime.datetime, StripeApiSubscription]]:
+        """
+        Returns (due_at, subscription) with due_at <= now in time order.
+        They stay due until mark_fired() is called for them.
+        """
+        now = now or datetime.datetime.utcnow()
+        with self._lock:
+            self._prune(now)
+        return self.upcoming(now)
+
+    def mark_fired(
+        self,
+        subscription_id: str,
+        due_at: datetime.datetime
+    ) -> None:
+        """
+        Removes subscription returned by due(), must be called after it's processed.
+        Nothing is changed if subscription was updated with another timestamp meanwhile.
+        """
+        with self._lock:
+            if not self._is_actual(due_at, subscription_id):
+                return
+            self._remove(subscription_id)
+            self._fired_at[subscription_id] = due_at
+            heapq.heappush(self._fired_heap, (due_at, subscription_id))
+            self._compact_if_sparse()
+
+    def pop_due(
+        self,
+        now: Optional[datetime.datetime] = None
+    ) -> Iterator[Tuple[datetime.datetime, StripeApiSubscription]]:
+        """
+        Yields (due_at, subscription) with due_at <= now in time order.
+        Subscription is removed from index when the next one is requested,
+        so subscription is left due if its processing raised.
+        """
+        for due_at, subscription in self.due(now):
+            yield due_at, subscription
+            self.mark_fired(subscription.id, due_at)
+
+    def upcoming(
+        self,
+        until: datetime.datetime
+    ) -> List[Tuple[datetime.datetime, StripeApiSubscription]]:
+        """
+        Returns (due_at, subscription) with due_at <= until in time order, index isn't changed.
+        E.g. subscriptions renewing in the next 3 days:
+            SubscriptionIndex("current_period_end").upcoming(utcnow() + timedelta(days=3))
+        """
+        result = []
+        with self._lock:
+            # Children of heap node are not earlier than node, so only due subtrees are visited.
+            stack = [0] if self._heap else []
+            while stack:
+                position = stack.pop()
+                due_at, subscription_id = self._heap[position]
+                if due_at > until:
+                    continue
+                if self._is_actual(due_at, subscription_id):
+                    result.append((due_at, self._subscriptions[subscription_id]))
+                for child in (2 * position + 1, 2 * position + 2):
+                    if child < len(self._heap):
+                        stack.append(child)
+        result.sort(key=lambda item: (item[0], item[1].id))
+        return result
+
+
+class SubscriptionScheduler:
+
+    """
+    Runs jobs (renewal reminders, dunning...) for due subscriptions.
+    Every job has its own SubscriptionIndex, so tick costs O(due subscriptions).
+    Example:
+        scheduler = SubscriptionScheduler()
+        scheduler.add_job("renewal_reminder", send_reminder, offset=timedelta(days=-3))
+        scheduler.add_job(
+            "dunning", start_dunning, offset=timedelta(hours=24), statuses=["past_due"]
+        )
+        scheduler.update_many(service.subscription_api.list_all())
+        scheduler.run_due()  # Call it periodically.
+    """
+
+    def __init__(self) -> None:
+        self.jobs: Dict[str, Tuple[SubscriptionIndex, Callable]] = {}
+
+    def add_job(
+        self,
+        name: str,
+        callback: Callable[[StripeApiSubscription], None],
+        field: str = "current_period_end",
+        offset: datetime.timedelta = datetime.timedelta(),
+        statuses: Optional[Iterable[str]] = None,
+        max_lateness: Optional[datetime.timedelta] = datetime.timedelta(days=30)
+    ) -> SubscriptionIndex:
+        """
+        :param callback: Called with subscription when field + offset is reached.
+        Other params are passed to SubscriptionIndex.
+        """
+        index = SubscriptionIndex(
+            field=field, offset=offset, statuses=statuses, max_lateness=max_lateness
+        )
+        self.jobs[name] = (index, callback)
+        return index
+
+    def update(
+        self,
+        subscription: StripeApiSubscription
+    ) -> None:
+        for index, callback in self.jobs.values():
+            index.update(subscription)
+
+    def update_many(
+        self,
+        subscriptions: Iterable[StripeApiSubscription]
+    ) -> None:
+        for subscription in subscriptions:
+            self.update(subscription)
+
+    def iter_due(
+        self,
+        now: Optional[datetime.datetime] = None
+    ) -> Iterator[Tuple[str, StripeApiSubscription]]:
+        """
+        Yields (job name, subscription) of all jobs in time order.
+        Subscription is marked fired when the next one is requested,
+        so if its processing raised it stays due for the next call.
+        """
+        now = now or datetime.datetime.utcnow()
+        due = [
+            [(due_at, name, subscription) for due_at, subscription in index.due(now)]
+            for name, (index, callback) in self.jobs.items()
+        ]
+        for due_at, name, subscription in heapq.merge(*due, key=lambda item: item[:2]):
+            yield name, subscription
+            self.jobs[name][0].mark_fired(subscription.id, due_at)
+
+    def run_due(
+        self,
+        now: Optional[datetime.datetime] = None
+    ) -> int:
+        """
+        Calls callbacks of due subscriptions in time order.
+        If callback raises, exception is raised and subscriptions which weren't processed
+        (including the failed one) are called on the next run_due().
+        :returns count of callbacks called.
+        """
+        count = 0
+        for name, subscription in self.iter_due(now):
+            self.jobs[name][1](subscription)
+            count += 1
+        return count
@@ -1,11 +1,45 @@
-from .customer import StripeApiCustomer
-from .payment_method import StripePaymentMethod, StripePaymentMethodCard
-from .price import (
-    StripeApiPrice,
-    StripeCurrencies,
-    StripePriceRecurring,
-    StripePriceRecurringIntervalEnum
-)
-from .product import StripeApiProduct
-from .session import StripeApiSession
-from .subscription import StripeApiSubscription
\ No newline at end of file
+import importlib
+from typing import Dict
+
+# Serializers are imported on first access, pydantic models are expensive to build.
+_SERIALIZER_MODULES = {
+    "StripeBaseModel": ".base",
+    "StripeApiCustomer": ".customer",
+    "StripePaymentMethod": ".payment_method",
+    "StripePaymentMethodCard": ".payment_method",
+    "StripeApiPrice": ".price",
+    "StripeCurrencies": ".price",
+    "StripePriceRecurring": ".price",
+    "StripePriceRecurringIntervalEnum": ".price",
+    "StripeApiProduct": ".product",
+    "StripeApiSession": ".session",
+    "StripeApiSubscription": ".subscription",
+}
+
+__all__ = list(_SERIALIZER_MODULES) + ["build_schemas"]
+
+
+def __getattr__(name: str):
+    module_name = _SERIALIZER_MODULES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return __all__
+
+
+def build_schemas() -> Dict[str, dict]:
+    """
+    Imports all serializers and builds their JSON schemas (pydantic caches them).
+    :returns {serializer name: schema}
+    """
+    schemas = {}
+    for name in _SERIALIZER_MODULES:
+        serializer = __getattr__(name)
+        if hasattr(serializer, "schema"):
+            schemas[name] = serializer.schema()
+    return schemas
@@ -0,0 +1,25 @@
+from pydantic import BaseModel, PrivateAttr
+
+
+class StripeBaseModel(BaseModel):
+    """
+    Base class for all Stripe API serializers.
+    """
+
+    _stale: bool = PrivateAttr(default=False)
+
+    @property
+    def is_stale(self) -> bool:
+        """
+        True if object was served from the last known good response
+        while Stripe was unavailable (see stripe_subscription.circuit_breaker).
+        """
+        return self._stale
+
+    def as_stale(self):
+        """
+        Returns copy of object marked as stale.
+        """
+        stale = self.copy()
+        stale._stale = True
+        return stale
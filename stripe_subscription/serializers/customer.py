@@ -1,9 +1,11 @@
-from pydantic import BaseModel, validator
+from pydantic import validator
 from typing import Union
 import datetime
 
+from .base import StripeBaseModel
 
-class StripeApiCustomer(BaseModel):
+
+class StripeApiCustomer(StripeBaseModel):
     id: str
     email: str
     object: str
@@ -1,14 +1,15 @@
-from pydantic import BaseModel
 import datetime
 
+from .base import StripeBaseModel
 
-class StripePaymentMethodCard(BaseModel):
+
+class StripePaymentMethodCard(StripeBaseModel):
     exp_month: int
     exp_year: int
     last4: str
 
 
-class StripePaymentMethod(BaseModel):
+class StripePaymentMethod(StripeBaseModel):
 
     id: str
     customer: str = None
@@ -1,6 +1,7 @@
-from pydantic import BaseModel
 from enum import Enum
 
+from .base import StripeBaseModel
+
 
 class StripeCurrencies(Enum):
     """
@@ -19,7 +20,7 @@ class StripePriceRecurringIntervalEnum(Enum):
     year = "year"
 
 
-class StripePriceRecurring(BaseModel):
+class StripePriceRecurring(StripeBaseModel):
     """
     StripePriceRecurring
     """
@@ -30,7 +31,7 @@ class StripePriceRecurring(BaseModel):
         use_enum_values = True
 
 
-class StripeApiPrice(BaseModel):
+class StripeApiPrice(StripeBaseModel):
     """
     StripeApiPrice
     """
@@ -1,7 +1,7 @@
-from pydantic import BaseModel
+from .base import StripeBaseModel
 
 
-class StripeApiProduct(BaseModel):
+class StripeApiProduct(StripeBaseModel):
 
     id: str
     name: str
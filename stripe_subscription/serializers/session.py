@@ -1,6 +1,7 @@
-from pydantic import BaseModel
 from enum import Enum
 
+from .base import StripeBaseModel
+
 
 class StripePaymentStatusEnum(Enum):
     paid = "paid"
@@ -8,7 +9,7 @@ class StripePaymentStatusEnum(Enum):
     no_payment_required = "no_payment_required"
 
 
-class StripeApiSession(BaseModel):
+class StripeApiSession(StripeBaseModel):
     id: str
     url: str
     cancel_url: str
@@ -1,8 +1,9 @@
 from typing import List
 from enum import Enum
 import datetime
-from pydantic import BaseModel, validator
+from pydantic import validator
 
+from .base import StripeBaseModel
 from .price import StripeApiPrice
 
 
@@ -23,13 +24,13 @@ class StripeSubscriptionCollectionMethodEnum(Enum):
     send_invoice = "send_invoice"
 
 
-class StripeApiSubscriptionItem(BaseModel):
+class StripeApiSubscriptionItem(StripeBaseModel):
     id: str
     quantity: int
     price: StripeApiPrice
 
 
-class StripeApiSubscription(BaseModel):
+class StripeApiSubscription(StripeBaseModel):
 
     id: str
     customer: str
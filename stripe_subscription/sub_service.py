@@ -1,20 +1,22 @@
-from typing import Tuple
-from stripe_subscription.base_api import (
-    StripeCustomerApi,
-    StripePaymentMethodApi,
-    StripeProductApi,
-    StripePriceApi,
-    StripeSubscriptionApi
-)
-from stripe_subscription.serializers import (
-    StripeApiCustomer,
-    StripeApiPrice,
-    StripePriceRecurring,
-    StripePriceRecurringIntervalEnum,
-    StripePaymentMethod,
-    StripeApiSubscription
-)
+import functools
+from typing import Tuple, Optional, TYPE_CHECKING
 from stripe_subscription.exceptions import ActiveSubscriptionFoundException
+from stripe_subscription.profiling import profiled_operation
+
+if TYPE_CHECKING:
+    from stripe_subscription.base_api import (
+        StripeCustomerApi,
+        StripePaymentMethodApi,
+        StripeProductApi,
+        StripePriceApi,
+        StripeSubscriptionApi
+    )
+    from stripe_subscription.serializers import (
+        StripeApiCustomer,
+        StripeApiPrice,
+        StripePaymentMethod,
+        StripeApiSubscription
+    )
 
 
 class StripeSubscriptionService:
@@ -38,18 +40,143 @@ class StripeSubscriptionService:
 
     def __init__(
         self,
-        api_key: str
+        api_key: str,
+        circuit_breaker_options: Optional[dict] = None,
+        hedging_options: Optional[dict] = None,
+        negative_cache_options: Optional[dict] = None,
+        rate_limit_options: Optional[dict] = None,
+        profiling_options: Optional[dict] = None,
+        write_coalescing_options: Optional[dict] = None
+    ) -> None:
+        """
+        API clients (and Stripe SDK with serializers) are created on first use,
+        so service is cheap to import and to construct. See warm_up().
+        :param api_key: str - Api Key
+        :param circuit_breaker_options: dict - Enables circuit breaker per endpoint family.
+            Options are passed to CircuitBreaker. Pass {} to use default thresholds.
+        :param hedging_options: dict - Enables hedging of read requests.
+            Options are passed to RequestHedger, hedge budget is shared by all endpoints.
+        :param negative_cache_options: dict - Enables short living cache of lookups
+            which returned nothing. Options are passed to NegativeCache.
+        :param rate_limit_options: dict - Enables limit of requests rate shared by all endpoints.
+            Options are passed to RateLimiter.
+        :param profiling_options: dict - Enables sampled profiling of operations.
+            Options are passed to OperationProfiler, e.g. {"sample_rate": 0.01}.
+        :param write_coalescing_options: dict - Enables coalescing of customer updates
+            (StripeCustomerApi.modify_coalesced). Options are passed to WriteCoalescer,
+            e.g. {"window": 0.05}.
+        """
+        self.api_key = api_key
+        self.circuit_breaker_options = circuit_breaker_options
+        self.negative_cache_options = negative_cache_options
+        self.write_coalescing_options = write_coalescing_options
+        self.hedger = None
+        if hedging_options is not None:
+            from stripe_subscription.hedging import RequestHedger
+            self.hedger = RequestHedger(**hedging_options)
+        self.rate_limiter = None
+        if rate_limit_options is not None:
+            from stripe_subscription.rate_limit import RateLimiter
+            self.rate_limiter = RateLimiter(**rate_limit_options)
+        self.profiler = None
+        if profiling_options is not None:
+            from stripe_subscription.profiling import OperationProfiler
+            self.profiler = OperationProfiler(**profiling_options)
+
+    def _api_options(
+        self,
+        name: str
+    ) -> dict:
+        """
+        :param name: str - Endpoint family name.
+        :returns kwargs for StripeApi client.
+        """
+        from stripe_subscription.circuit_breaker import CircuitBreaker
+        from stripe_subscription.negative_cache import NegativeCache
+
+        options = {
+            "api_key": self.api_key,
+            "hedger": self.hedger,
+            "rate_limiter": self.rate_limiter,
+            "profiler": self.profiler,
+            "circuit_breaker": None,
+            "negative_cache": None
+        }
+        if self.circuit_breaker_options is not None:
+            options["circuit_breaker"] = CircuitBreaker(name, **self.circuit_breaker_options)
+        if self.negative_cache_options is not None:
+            options["negative_cache"] = NegativeCache(**self.negative_cache_options)
+        return options
+
+    @functools.cached_property
+    def customer_api(self) -> "StripeCustomerApi":
+        from stripe_subscription.base_api import StripeCustomerApi
+        return StripeCustomerApi(
+            write_coalescing_options=self.write_coalescing_options,
+            **self._api_options("Customer")
+        )
+
+    @functools.cached_property
+    def payment_method_api(self) -> "StripePaymentMethodApi":
+        from stripe_subscription.base_api import StripePaymentMethodApi
+        return StripePaymentMethodApi(**self._api_options("PaymentMethod"))
+
+    @functools.cached_property
+    def product_api(self) -> "StripeProductApi":
+        from stripe_subscription.base_api import StripeProductApi
+        return StripeProductApi(**self._api_options("Product"))
+
+    @functools.cached_property
+    def price_api(self) -> "StripePriceApi":
+        from stripe_subscription.base_api import StripePriceApi
+        return StripePriceApi(**self._api_options("Price"))
+
+    @functools.cached_property
+    def subscription_api(self) -> "StripeSubscriptionApi":
+        from stripe_subscription.base_api import StripeSubscriptionApi
+        return StripeSubscriptionApi(**self._api_options("Subscription"))
+
+    def warm_up(self) -> None:
+        """
+        Imports Stripe SDK, builds all serializers with their schemas and API clients.
+        On serverless platforms call it at module level (init phase),
+        if init phase time is cheaper than first request latency.
+        """
+        from stripe_subscription.serializers import build_schemas
+
+        build_schemas()
+        for name in (
+            "customer_api",
+            "payment_method_api",
+            "product_api",
+            "price_api",
+            "subscription_api"
+        ):
+            getattr(self, name)
+
+    def load_known_keys(
+        self,
+        capacity: int = 100000,
+        error_rate: float = 0.01,
+        max_age: float = 3600.0
     ) -> None:
-        self.customer_api = StripeCustomerApi(api_key=api_key)
-        self.payment_method_api = StripePaymentMethodApi(api_key=api_key)
-        self.product_api = StripeProductApi(api_key=api_key)
-        self.price_api = StripePriceApi(api_key=api_key)
-        self.subscription_api = StripeSubscriptionApi(api_key=api_key)
+        """
+        Loads emails of all customers, product urls and price lookup keys into Bloom filters.
+        After that get_or_create_customer and get_or_create_price go straight
+        to create for new values (with idempotency key) instead of lookup request.
+        Use it only if customers and prices are created through this package.
+        It's safe with many processes: their idempotency keys are the same,
+        so objects created concurrently by other processes are collapsed by Stripe.
+        Filters are dropped after max_age seconds, call it periodically to reload them.
+        """
+        for api in (self.customer_api, self.product_api, self.price_api):
+            api.load_known_keys(capacity=capacity, error_rate=error_rate, max_age=max_age)
 
+    @profiled_operation
     def get_or_create_customer(
         self,
         email: str
-    ) -> Tuple[StripeApiCustomer, bool]:
+    ) -> Tuple["StripeApiCustomer", bool]:
         """
         Method creates customer into StripeAPI.
         Method pipeline:
@@ -64,13 +191,14 @@ class StripeSubscriptionService:
         user = self.customer_api.create(email=email)
         return user, True
 
+    @profiled_operation
     def get_or_create_price(
         self,
         product_name: str,
         amount: int,
         recurring_count: int = 1000, # How many times get money.
         year_interval: bool = False # Default interval is month. Set True for year subscription.
-    ) -> Tuple[StripeApiPrice, bool]:
+    ) -> Tuple["StripeApiPrice", bool]:
         """
         Method pipeline:
             1.Check if price exists. If yes return price.
@@ -81,6 +209,11 @@ class StripeSubscriptionService:
             5.Return created price.
         :returns Tuple[StripeApiPrice, bool] - (StripeApiPrice, is_created)
         """
+        from stripe_subscription.serializers import (
+            StripePriceRecurring,
+            StripePriceRecurringIntervalEnum
+        )
+
         rc = f"{recurring_count}_times"
         yi = f"{'yearly' if year_interval else 'monthly'}"
         product_name = f"{product_name}_{amount}_{rc}_{yi}"
@@ -101,25 +234,30 @@ class StripeSubscriptionService:
         )
         return price, True
 
+    @profiled_operation
     def get_or_create_payment_method(
             self,
             customer_email: str,
             card_number: str,
             exp_month: int,
             exp_year: int,
-            cvc: str
-    ) -> Tuple[StripePaymentMethod, bool]:
+            cvc: str,
+            customer_fields: Optional[dict] = None
+    ) -> Tuple["StripePaymentMethod", bool]:
         """
         :param customer_email: str
         :param card_number: str
         :param exp_month: int
         :param exp_year: int
         :param cvc: cvc
+        :param customer_fields: dict - Other customer fields (name, address, metadata...)
+            updated by the same request which sets created payment method as default.
         Function pipeline
             1. Get or create customer from API by email.
             1. Check for exists payment_method into Customer's methods list.
             2. Create PaymentMethod if not, retrieve if exists.
             3. Attach Customer to PaymentMethod if created.
+            4. Set created PaymentMethod as Customer's default one.
         :return: StripePaymentMethod, created: bool
         """
         customer, created = self.get_or_create_customer(email=customer_email)
@@ -155,19 +293,25 @@ class StripeSubscriptionService:
             customer=customer,
             payment_method=payment_method
         )
-        self.payment_method_api.stripe.Customer.modify(
-            customer.id,
-            invoice_settings={
-                "default_payment_method": payment_method.id
-            }
+        from stripe_subscription.write_coalescing import merge_fields
+
+        fields = merge_fields(
+            merge_fields({}, customer_fields or {}),
+            {"invoice_settings": {"default_payment_method": payment_method.id}}
         )
+        if self.customer_api.write_coalescer is None:
+            self.customer_api.modify(customer.id, **fields)
+        else:
+            # Coalesced with other updates of the customer, e.g. made concurrently by app.
+            self.customer_api.modify_coalesced(customer.id, **fields).result()
         return attached_payment_method, True
 
+    @profiled_operation
     def create_subscription_if_not_exist(
         self,
-        customer: StripeApiCustomer,
-        price: StripeApiPrice
-    ) -> StripeApiSubscription:
+        customer: "StripeApiCustomer",
+        price: "StripeApiPrice"
+    ) -> "StripeApiSubscription":
         """
         1. Check for existing and active subscription.
         2. If exists - Raise Exception
@@ -192,6 +336,7 @@ class StripeSubscriptionService:
         )
         return subscription
 
+    @profiled_operation
     def get_customer_subscriptions(
             self,
             customer_email: str
@@ -202,6 +347,7 @@ class StripeSubscriptionService:
         )
         return customer_subs
 
+    @profiled_operation
     def retrieve_subscription(
             self,
             subscription_id: str
@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+
+from stripe_subscription.sub_service import StripeSubscriptionService
+
+
+class StripeServiceRegistry:
+
+    """
+    Pool of StripeSubscriptionService per Stripe account (API key).
+    Every tenant has its own service, so its API key, caches (circuit breakers,
+    negative cache, known keys) and rate limiter aren't shared with other tenants.
+    Services are shared by all threads and coroutines.
+    The least recently used services are evicted if pool is full,
+    services which weren't used during idle_timeout are evicted too.
+    Thread pools are per service too: every circuit breaker has its own probe thread,
+    hedger and write coalescer have their own pools, so a slow tenant doesn't delay
+    other tenants. Their threads are started on first use and exit when evicted service
+    is garbage collected.
+    Shared by all tenants:
+        - HTTP connections, they are pooled by Stripe SDK client,
+        - AsyncStripeSubscriptionService.EXECUTOR, which runs calls of async services.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1000,
+        idle_timeout: float = 900.0,
+        **service_options
+    ) -> None:
+        """
+        :param max_size: int - Max count of services into pool.
+        :param idle_timeout: float - Seconds. Unused service is evicted after this time.
+        :param service_options: Passed to every StripeSubscriptionService,
+            e.g. rate_limit_options={"rate": 25} gives each tenant its own budget.
+        """
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.service_options = service_options
+        self._services = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        api_key: str
+    ) -> StripeSubscriptionService:
+        """
+        Returns service of tenant, creates it on first call.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._services.get(api_key)
+            if entry is None:
+                entry = [StripeSubscriptionService(api_key, **self.service_options), now]
+                self._services[api_key] = entry
+            entry[1] = now
+            self._services.move_to_end(api_key)
+            self._evict(now)
+            return entry[0]
+
+    def get_async(
+        self,
+        api_key: str
+    ):
+        """
+        Returns AsyncStripeSubscriptionService which wraps shared service of tenant.
+        """
+        from stripe_subscription.async_sub_service import AsyncStripeSubscriptionService
+        return AsyncStripeSubscriptionService.from_sync_service(self.get(api_key))
+
+    def evict(
+        self,
+        api_key: str
+    ) -> None:
+        with self._lock:
+            self._services.pop(api_key, None)
+
+    def __len__(self) -> int:
+        return len(self._services)
+
+    def _evict(
+        self,
+        now: float
+    ) -> None:
+        while len(self._services) > self.max_size:
+            self._services.popitem(last=False)
+        while self._services:
+            api_key, (service, used_at) = next(iter(self._services.items()))
+            if now - used_at < self.idle_timeout:
+                break
+            del self._services[api_key]
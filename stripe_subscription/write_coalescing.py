@@ -0,0 +1,130 @@
+import functools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Tuple
+
+
+def merge_fields(
+    target: dict,
+    fields: dict
+) -> dict:
+    """
+    Merges fields into target, the last write wins per field.
+    Nested dicts (metadata, invoice_settings, address) are merged per key,
+    like Stripe applies separate updates.
+    """
+    for name, value in fields.items():
+        if isinstance(value, dict) and isinstance(target.get(name), dict):
+            merge_fields(target[name], value)
+        elif isinstance(value, dict):
+            target[name] = merge_fields({}, value)
+        else:
+            target[name] = value
+    return target
+
+
+class WriteCoalescer:
+
+    """
+    Merges writes of the same object made within window into one write.
+    The first write of object starts window, writes made during it are merged
+    (see merge_fields) and applied by one apply(key, fields) call.
+    Every caller gets Future resolved with result of merged write.
+    Writes of the same object are applied one by one in submit order.
+    Coalescer has one scheduler thread, which lives while batches are waiting,
+    and its own pool of max_workers threads for apply calls.
+    """
+
+    def __init__(
+        self,
+        apply: Callable[[Hashable, dict], Any],
+        window: float = 0.05,
+        max_workers: int = 4
+    ) -> None:
+        """
+        :param apply: Callable - Makes merged write, e.g. StripeCustomerApi.modify.
+        :param window: float - Seconds writes are collected before apply.
+        :param max_workers: int - Max count of apply calls in flight.
+        """
+        self.apply = apply
+        self.window = window
+        self.max_workers = max_workers
+        self._pending: Dict[Hashable, Tuple[dict, List[Future]]] = {}
+        self._in_flight = set()
+        # (deadline, key) of scheduled batches. Window is constant, so deadlines are ordered.
+        self._deadlines = deque()
+        self._scheduler = None
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+
+    @functools.cached_property
+    def executor(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="write-coalescer"
+        )
+
+    def submit(
+        self,
+        key: Hashable,
+        fields: dict
+    ) -> Future:
+        future = Future()
+        with self._lock:
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = self._pending[key] = ({}, [])
+                # Batch waiting for write in flight is scheduled when that write is finished.
+                if key not in self._in_flight:
+                    self._schedule(key)
+            merge_fields(batch[0], fields)
+            batch[1].append(future)
+        return future
+
+    def _schedule(
+        self,
+        key: Hashable
+    ) -> None:
+        """
+        Must be called with lock held.
+        """
+        self._deadlines.append((time.monotonic() + self.window, key))
+        if self._scheduler is None:
+            self._scheduler = threading.Thread(
+                target=self._run_scheduler, name="write-coalescer-scheduler", daemon=True
+            )
+            self._scheduler.start()
+
+    def _run_scheduler(self) -> None:
+        with self._condition:
+            while self._deadlines:
+                deadline, key = self._deadlines[0]
+                timeout = deadline - time.monotonic()
+                if timeout > 0:
+                    self._condition.wait(timeout)
+                    continue
+                self._deadlines.popleft()
+                self.executor.submit(self._flush, key)
+            self._scheduler = None
+
+    def _flush(
+        self,
+        key: Hashable
+    ) -> None:
+        with self._lock:
+            fields, futures = self._pending.pop(key)
+            self._in_flight.add(key)
+        try:
+            result = self.apply(key, fields)
+        except Exception as error:
+            for future in futures:
+                future.set_exception(error)
+        else:
+            for future in futures:
+                future.set_result(result)
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
+                if key in self._pending:
+                    self._schedule(key)
@@ -0,0 +1,152 @@
+import threading
+
+import pytest
+import stripe
+
+from stripe_subscription import circuit_breaker as circuit_breaker_module
+from stripe_subscription.circuit_breaker import CircuitBreaker, CircuitStateEnum
+from stripe_subscription.exceptions import CircuitOpenException
+
+
+class FakeClock:
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(circuit_breaker_module.time, "monotonic", clock)
+    return clock
+
+
+def fail():
+    raise stripe.error.APIConnectionError("Stripe is down")
+
+
+def make_breaker(**options):
+    options = {"window_size": 4, "minimum_calls": 4, "reset_timeout": 30.0, **options}
+    return CircuitBreaker("Customer", **options)
+
+
+def open_breaker(breaker):
+    while breaker.state == CircuitStateEnum.closed:
+        with pytest.raises(stripe.error.APIConnectionError):
+            breaker.write(fail)
+
+
+def test_opens_when_failure_rate_reached(clock):
+    breaker = make_breaker()
+    breaker.write(lambda: 1)
+    for _ in range(2):
+        with pytest.raises(stripe.error.APIConnectionError):
+            breaker.write(fail)
+    assert breaker.state == CircuitStateEnum.closed
+    with pytest.raises(stripe.error.APIConnectionError):
+        breaker.write(fail)
+    assert breaker.state == CircuitStateEnum.open
+
+
+def test_client_errors_are_not_failures(clock):
+    breaker = make_breaker()
+
+    def not_found():
+        raise stripe.error.InvalidRequestError("No such customer", "id")
+
+    for _ in range(10):
+        with pytest.raises(stripe.error.InvalidRequestError):
+            breaker.write(not_found)
+    assert breaker.state == CircuitStateEnum.closed
+
+
+def test_slow_calls_are_failures(clock):
+    breaker = make_breaker(slow_call_threshold=1.0)
+
+    def slow():
+        clock.now += 2.0
+        return 1
+
+    for _ in range(4):
+        assert breaker.write(slow) == 1
+    assert breaker.state == CircuitStateEnum.open
+
+
+def test_open_breaker_serves_stale_reads_and_fails_writes(clock):
+    breaker = make_breaker()
+    assert breaker.read("key", lambda: "good") == "good"
+    open_breaker(breaker)
+    fetch_calls = []
+    assert breaker.read("key", lambda: fetch_calls.append(1)) == "good"
+    assert fetch_calls == []
+    with pytest.raises(CircuitOpenException):
+        breaker.read("other", lambda: "value")
+    with pytest.raises(CircuitOpenException):
+        breaker.write(lambda: "value")
+
+
+def test_successful_probe_closes_breaker(clock):
+    breaker = make_breaker()
+    open_breaker(breaker)
+    clock.now += 30.0
+    assert breaker.state == CircuitStateEnum.half_open
+    assert breaker.write(lambda: "value") == "value"
+    assert breaker.state == CircuitStateEnum.closed
+
+
+def test_failed_probe_opens_breaker_again(clock):
+    breaker = make_breaker()
+    open_breaker(breaker)
+    clock.now += 30.0
+    with pytest.raises(stripe.error.APIConnectionError):
+        breaker.write(fail)
+    assert breaker.state == CircuitStateEnum.open
+    with pytest.raises(CircuitOpenException):
+        breaker.write(lambda: "value")
+
+
+def test_only_one_probe_is_let_through(clock):
+    breaker = make_breaker()
+    open_breaker(breaker)
+    clock.now += 30.0
+    probe_started = threading.Event()
+    release_probe = threading.Event()
+
+    def probe():
+        probe_started.set()
+        release_probe.wait(5)
+        return "value"
+
+    thread = threading.Thread(target=breaker.write, args=(probe,))
+    thread.start()
+    probe_started.wait(5)
+    with pytest.raises(CircuitOpenException):
+        breaker.write(lambda: "value")
+    release_probe.set()
+    thread.join(5)
+    assert breaker.state == CircuitStateEnum.closed
+
+
+def test_read_with_stale_response_probes_in_background(clock):
+    breaker = make_breaker()
+    breaker.read("key", lambda: "old")
+    open_breaker(breaker)
+    clock.now += 30.0
+    revalidated = threading.Event()
+
+    def fetch():
+        revalidated.set()
+        return "new"
+
+    assert breaker.read("key", fetch) == "old"
+    assert revalidated.wait(5)
+    breaker.executor.shutdown(wait=True)
+    assert breaker.state == CircuitStateEnum.closed
+    assert breaker.read("key", lambda: "newest") == "newest"
+
+
+def test_breakers_have_own_probe_executors():
+    assert make_breaker().executor is not make_breaker().executor
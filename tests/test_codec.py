@@ -0,0 +1,101 @@
+import datetime
+import marshal
+
+import pytest
+
+from stripe_subscription import codec
+from stripe_subscription.exceptions import (
+    CodecDecodeException,
+    UnsupportedCodecVersionException
+)
+from stripe_subscription.serializers import StripeApiCustomer, StripeApiSubscription
+
+
+def make_subscription(number=1):
+    return StripeApiSubscription(
+        id=f"sub_{number}",
+        customer="cus_1",
+        status="active",
+        created=datetime.datetime(2026, 1, 1, 12, 30),
+        current_period_end=datetime.datetime(2026, 2, 1, 12, 30, 0, 500),
+        items={"data": [{
+            "id": "si_1",
+            "quantity": 1,
+            "price": {
+                "id": "price_1",
+                "unit_amount": 799,
+                "recurring": {"interval": "month", "interval_count": 1},
+                "product": "prod_1"
+            }
+        }]}
+    )
+
+
+def payload(tables, rows):
+    return bytes([codec.CODEC_VERSION, codec.MARSHAL_VERSION]) + marshal.dumps(
+        (tables, rows), codec.MARSHAL_VERSION
+    )
+
+
+def test_round_trip():
+    subscriptions = [make_subscription(number) for number in range(3)]
+    decoded = codec.decode_many(codec.encode_many(subscriptions), StripeApiSubscription)
+    assert decoded == subscriptions
+    assert decoded[0].items[0].price.recurring.interval == "month"
+
+
+def test_header_has_codec_and_marshal_versions():
+    data = codec.encode(make_subscription())
+    assert data[0] == codec.CODEC_VERSION
+    assert data[1] == codec.MARSHAL_VERSION == 4
+
+
+def test_version_one_payload_is_decoded():
+    data = codec.encode(make_subscription())
+    old_data = bytes([1]) + data[2:]
+    assert codec.decode(old_data, StripeApiSubscription) == make_subscription()
+
+
+def test_newer_versions_are_rejected():
+    data = codec.encode(make_subscription())
+    with pytest.raises(UnsupportedCodecVersionException):
+        codec.decode(bytes([codec.CODEC_VERSION + 1]) + data[1:], StripeApiSubscription)
+    with pytest.raises(UnsupportedCodecVersionException):
+        codec.decode(data[:1] + bytes([marshal.version + 1]) + data[2:], StripeApiSubscription)
+
+
+def test_unknown_fields_are_dropped_and_optional_fields_get_defaults():
+    data = payload(
+        {"StripeApiCustomer": ("id", "email", "object", "balance", "created", "removed_field")},
+        [("cus_1", "email@example.com", "customer", 0, 1672531200, "value")]
+    )
+    customer = codec.decode(data, StripeApiCustomer)
+    assert customer.id == "cus_1"
+    assert customer.name is None
+    assert not hasattr(customer, "removed_field")
+
+
+def test_missing_required_field_raises():
+    data = payload(
+        {"StripeApiCustomer": ("id", "object", "balance", "created")},
+        [("cus_1", "customer", 0, 1672531200)]
+    )
+    with pytest.raises(CodecDecodeException, match="StripeApiCustomer.email"):
+        codec.decode(data, StripeApiCustomer)
+
+
+def test_code_objects_are_rejected():
+    data = payload(
+        {"StripeApiCustomer": ("id", "email", "object", "balance", "created")},
+        [("cus_1", compile("1", "<payload>", "eval"), "customer", 0, 1672531200)]
+    )
+    with pytest.raises(CodecDecodeException, match="code"):
+        codec.decode(data, StripeApiCustomer)
+
+
+def test_corrupted_payload_raises():
+    data = codec.encode(make_subscription())
+    with pytest.raises(CodecDecodeException):
+        codec.decode(data[:len(data) // 2], StripeApiSubscription)
+    with pytest.raises(CodecDecodeException):
+        codec.decode(b"", StripeApiSubscription)
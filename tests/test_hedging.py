@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+from stripe_subscription.hedging import LatencyTracker, RequestHedger
+
+
+def test_percentile_needs_minimum_samples():
+    tracker = LatencyTracker(window_size=10)
+    for latency in range(1, 5):
+        tracker.add("Customer.get_by_id", latency)
+    assert tracker.percentile("Customer.get_by_id", 0.5, minimum_samples=5) is None
+    tracker.add("Customer.get_by_id", 5)
+    assert tracker.percentile("Customer.get_by_id", 0.5, minimum_samples=5) == 3
+    assert tracker.percentile("Customer.get_by_email", 0.5) is None
+
+
+def test_late_request_is_hedged_and_first_response_wins():
+    hedger = RequestHedger(default_delay=0.02, budget_ratio=1.0)
+    calls = []
+    release_first = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        if len(calls) == 1:
+            release_first.wait(5)
+            return "first"
+        return "second"
+
+    assert hedger.call("Customer.get_by_id", fetch) == "second"
+    release_first.set()
+    assert hedger.hedges_count == 1
+    assert len(calls) == 2
+
+
+def test_hedges_are_limited_by_budget():
+    hedger = RequestHedger(default_delay=0.01, budget_ratio=0.5, max_budget=1.0)
+
+    def fetch():
+        time.sleep(0.03)
+        return "value"
+
+    for _ in range(6):
+        assert hedger.call("Customer.get_by_id", fetch) == "value"
+    assert hedger.requests_count == 6
+    # Every request earns 0.5 tokens, hedge costs one token.
+    assert hedger.hedges_count == 3
+
+
+def test_hedges_are_limited_by_pool_size():
+    hedger = RequestHedger(default_delay=0.01, budget_ratio=1.0, max_hedges_in_flight=1)
+    release = threading.Event()
+
+    def fetch():
+        release.wait(5)
+        return "value"
+
+    threads = [
+        threading.Thread(target=hedger.call, args=("Customer.get_by_id", fetch))
+        for _ in range(3)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert hedger.hedges_count == 1
+
+
+def test_error_is_raised_only_if_all_requests_failed():
+    hedger = RequestHedger(default_delay=0.01, budget_ratio=1.0)
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.05)
+            raise ValueError("first failed")
+        return "second"
+
+    assert hedger.call("Customer.get_by_id", fetch) == "second"
+
+    def fail():
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        hedger.call("Customer.get_by_id", fail)
+
+
+def test_reads_in_flight_are_not_limited():
+    hedger = RequestHedger(default_delay=10.0)
+
+    def fetch():
+        time.sleep(0.1)
+        return "value"
+
+    threads = [
+        threading.Thread(target=hedger.call, args=("Customer.get_by_id", fetch))
+        for _ in range(50)
+    ]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert time.monotonic() - started < 0.5
+
+
+def test_latency_is_counted_from_request_start():
+    hedger = RequestHedger(default_delay=10.0)
+    hedger.call("Customer.get_by_id", lambda: time.sleep(0.05))
+    latency = hedger.latency_tracker.percentile("Customer.get_by_id", 0.5)
+    assert 0.05 <= latency < 0.2
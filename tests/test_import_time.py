@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Generous for slow CI machines, import takes a few milliseconds locally.
+MAX_IMPORT_TIME = 0.1
+
+HEAVY_MODULES = ("stripe", "pydantic", "tracemalloc")
+
+
+def run_python(code, *options):
+    return subprocess.run(
+        [sys.executable, *options, "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+
+def imported_modules(importtime_output):
+    """
+    :returns {module: cumulative seconds} from -X importtime output.
+    """
+    modules = {}
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative) / 1_000_000
+    return modules
+
+
+def test_service_import_is_cheap():
+    result = run_python("import stripe_subscription.sub_service", "-X", "importtime")
+    modules = imported_modules(result.stderr)
+    for name in modules:
+        assert name.split(".")[0] not in HEAVY_MODULES, f"{name} is imported eagerly"
+        assert not name.startswith("stripe_subscription.serializers"), (
+            f"{name} is imported eagerly"
+        )
+    assert modules["stripe_subscription.sub_service"] < MAX_IMPORT_TIME
+
+
+def test_client_doesnt_import_serializers_until_call():
+    result = run_python(
+        "import sys\n"
+        "from stripe_subscription.sub_service import StripeSubscriptionService\n"
+        "service = StripeSubscriptionService('sk_test')\n"
+        "service.customer_api\n"
+        "print(','.join(sorted(sys.modules)))\n"
+    )
+    modules = result.stdout.strip().split(",")
+    assert "stripe" in modules
+    assert "pydantic" not in modules
+    assert not [name for name in modules if name.startswith("stripe_subscription.serializers.")]
+
+
+def test_warm_up_imports_everything():
+    result = run_python(
+        "import sys\n"
+        "from stripe_subscription.sub_service import StripeSubscriptionService\n"
+        "StripeSubscriptionService('sk_test').warm_up()\n"
+        "print(','.join(sorted(sys.modules)))\n"
+    )
+    modules = result.stdout.strip().split(",")
+    assert "pydantic" in modules
+    assert "stripe_subscription.serializers.subscription" in modules
@@ -0,0 +1,149 @@
+from unittest import mock
+
+import pytest
+import stripe
+
+from stripe_subscription.base_api import (
+    StripeCustomerApi,
+    StripePaymentMethodApi,
+    StripeProductApi
+)
+from stripe_subscription.negative_cache import BloomFilter, NegativeCache
+
+
+def list_object(data):
+    return stripe.ListObject.construct_from(
+        {"object": "list", "data": data, "has_more": False, "url": "/v1/customers"},
+        "sk_test"
+    )
+
+
+CUSTOMER = {
+    "id": "cus_1",
+    "email": "known@example.com",
+    "object": "customer",
+    "balance": 0,
+    "created": 1672531200
+}
+
+
+@pytest.fixture
+def customer_api():
+    api = StripeCustomerApi("sk_test", negative_cache=NegativeCache())
+    with mock.patch("stripe.Customer.list", return_value=list_object([CUSTOMER])):
+        api.load_known_keys(capacity=100)
+    return api
+
+
+def test_bloom_filter_has_no_false_negatives():
+    known_keys = BloomFilter(capacity=1000, error_rate=0.01)
+    items = [f"email{number}@example.com" for number in range(1000)]
+    for item in items:
+        known_keys.add(item)
+    assert all(item in known_keys for item in items)
+    false_positives = sum(f"other{number}@example.com" in known_keys for number in range(1000))
+    assert false_positives < 50
+
+
+def test_negative_cache_entry_expires():
+    cache = NegativeCache(ttl=10.0)
+    with mock.patch("time.monotonic", return_value=100.0):
+        cache.add("key")
+        assert "key" in cache
+    with mock.patch("time.monotonic", return_value=111.0):
+        assert "key" not in cache
+
+
+def test_unknown_key_skips_lookup(customer_api):
+    with mock.patch("stripe.Customer.list") as customer_list:
+        assert customer_api.get_by_email("new@example.com") is None
+    customer_list.assert_not_called()
+    with mock.patch("stripe.Customer.list", return_value={"data": [CUSTOMER]}) as customer_list:
+        assert customer_api.get_by_email("known@example.com").id == "cus_1"
+    customer_list.assert_called_once()
+
+
+def test_known_keys_expire(customer_api):
+    customer_api.known_keys_expires_at = 0.0
+    with mock.patch("stripe.Customer.list", return_value={"data": []}) as customer_list:
+        assert customer_api.get_by_email("new@example.com") is None
+    customer_list.assert_called_once()
+    assert customer_api.known_keys is None
+    assert customer_api._create_idempotency_key(email="new@example.com") is None
+
+
+def test_load_known_keys_needs_lookup_operation():
+    with pytest.raises(NotImplementedError, match="no lookup operation"):
+        StripePaymentMethodApi("sk_test").load_known_keys()
+
+
+def replayed(data, replayed=True):
+    response = stripe.Customer.construct_from(data, "sk_test")
+    response._last_response = stripe.stripe_response.StripeResponse(
+        "{}", 200, {"Idempotent-Replayed": "true" if replayed else "false"}
+    )
+    return response
+
+
+def test_idempotency_key_depends_on_params_only(customer_api):
+    key = customer_api._create_idempotency_key(email="new@example.com")
+    assert key == customer_api._create_idempotency_key(email="new@example.com")
+    assert key != customer_api._create_idempotency_key(email="other@example.com")
+
+
+def test_clients_of_different_processes_have_the_same_key():
+    keys = []
+    for _ in range(2):
+        api = StripeCustomerApi("sk_test")
+        with mock.patch("stripe.Customer.list", return_value=list_object([])):
+            api.load_known_keys(capacity=100)
+        keys.append(api._create_idempotency_key(email="x@e.com"))
+    assert keys[0] is not None
+    assert keys[0] == keys[1]
+
+
+def test_max_age_is_limited_by_idempotency_key_ttl():
+    with pytest.raises(ValueError):
+        StripeCustomerApi("sk_test").load_known_keys(max_age=2 * 24 * 60 * 60)
+
+
+def test_replayed_deleted_customer_is_created_again(customer_api):
+    created = {**CUSTOMER, "id": "cus_2", "email": "new@example.com"}
+    responses = [replayed({**created, "id": "cus_deleted"}), replayed(created, replayed=False)]
+    deleted = {"id": "cus_deleted", "object": "customer", "deleted": True}
+    with mock.patch("stripe.Customer.create", side_effect=responses) as customer_create, \
+            mock.patch("stripe.Customer.retrieve", return_value=deleted):
+        assert customer_api.create("new@example.com").id == "cus_2"
+    first, second = (call.kwargs["idempotency_key"] for call in customer_create.call_args_list)
+    assert first == customer_api._create_idempotency_key(email="new@example.com")
+    assert second == customer_api._create_idempotency_key(
+        email="new@example.com", replaced="cus_deleted"
+    )
+
+
+def test_replayed_existing_customer_is_used(customer_api):
+    created = {**CUSTOMER, "id": "cus_2", "email": "new@example.com"}
+    with mock.patch("stripe.Customer.create", return_value=replayed(created)) as customer_create, \
+            mock.patch("stripe.Customer.retrieve", return_value=created):
+        assert customer_api.create("new@example.com").id == "cus_2"
+    customer_create.assert_called_once()
+
+
+def test_product_names_with_the_same_url_have_different_keys():
+    api = StripeProductApi("sk_test")
+    with mock.patch("stripe.Product.list", return_value=list_object([])):
+        api.load_known_keys(capacity=100)
+    created = {
+        "id": "prod_1",
+        "object": "product",
+        "name": "Gold plan",
+        "url": "https://Goldplan",
+        "created": 1672531200
+    }
+    with mock.patch("stripe.Product.create", return_value=created) as product_create:
+        api.create("Gold plan")
+        api.create("Gold  plan")
+    first, second = (call.kwargs for call in product_create.call_args_list)
+    assert first["url"] == second["url"] == "https://Goldplan"
+    assert first["idempotency_key"] != second["idempotency_key"]
+
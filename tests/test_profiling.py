@@ -0,0 +1,95 @@
+import functools
+import threading
+import time
+import tracemalloc
+
+from stripe_subscription import profiling
+from stripe_subscription.hedging import RequestHedger
+from stripe_subscription.profiling import (
+    CLIENT,
+    NETWORK,
+    OperationProfiler,
+    profile_phase
+)
+
+
+def test_phases_are_split():
+    profiler = OperationProfiler(sample_rate=1.0)
+
+    def operation():
+        profile_phase(CLIENT, profile_phase, NETWORK, time.sleep, 0.02)
+        time.sleep(0.01)
+        return "result"
+
+    assert profiler.run("operation", operation) == "result"
+    phases = profiler.samples[0].phases()
+    assert phases["network"] >= 0.02
+    assert phases["logic"] >= 0.01
+    assert "operation;network" in profiler.collapsed_stacks()
+
+
+def test_concurrent_traced_operations():
+    profiler = OperationProfiler(sample_rate=1.0, trace_allocations=True)
+    short_finished = threading.Event()
+    results = []
+
+    def long_operation():
+        short_finished.wait(5)
+        return [bytearray(1000) for _ in range(100)]
+
+    def short_operation():
+        return "short"
+
+    thread = threading.Thread(
+        target=lambda: results.append(profiler.run("long", long_operation))
+    )
+    thread.start()
+    time.sleep(0.05)
+    assert profiler.run("short", short_operation) == "short"
+    short_finished.set()
+    thread.join(5)
+    assert len(results[0]) == 100
+    assert len(profiler.samples) == 2
+    assert all(sample.allocations for sample in profiler.samples)
+    assert not tracemalloc.is_tracing()
+
+
+def test_tracing_started_by_application_isnt_stopped():
+    tracemalloc.start()
+    try:
+        OperationProfiler(sample_rate=1.0, trace_allocations=True).run("operation", list)
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_profiler_errors_dont_reach_caller(monkeypatch):
+    def broken_snapshot():
+        raise RuntimeError("tracemalloc is broken")
+
+    monkeypatch.setattr(tracemalloc, "take_snapshot", broken_snapshot)
+    profiler = OperationProfiler(sample_rate=1.0, trace_allocations=True)
+    assert profiler.run("operation", lambda: "result") == "result"
+    assert profiling._tracing_operations == 0
+    assert not tracemalloc.is_tracing()
+
+
+def test_only_used_hedged_request_is_counted():
+    profiler = OperationProfiler(sample_rate=1.0)
+    hedger = RequestHedger(default_delay=0.02, budget_ratio=1.0)
+    calls = []
+
+    def request():
+        calls.append(1)
+        time.sleep(0.2 if len(calls) == 1 else 0.01)
+        return "value"
+
+    fetch = functools.partial(profile_phase, CLIENT, profile_phase, NETWORK, request)
+    assert profiler.run("operation", hedger.call, "Customer.get_by_id", fetch) == "value"
+    sample = profiler.samples[0]
+    network_wall = sample.raw_phases[NETWORK][0]
+    assert 0.01 <= network_wall < 0.1
+    # Slow request finishes later and must not change stored sample.
+    time.sleep(0.25)
+    assert sample.raw_phases[NETWORK][0] == network_wall
+    assert sample.cpu >= sample.raw_phases[CLIENT][1]
@@ -0,0 +1,101 @@
+from unittest import mock
+
+import pytest
+import stripe
+
+from stripe_subscription.base_api import StripeCustomerApi, StripeSubscriptionApi
+from stripe_subscription.circuit_breaker import CircuitBreaker, CircuitStateEnum
+from stripe_subscription.exceptions import RateLimitExceededException
+from stripe_subscription.rate_limit import RateLimiter
+
+
+class CountingLimiter(RateLimiter):
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.acquired = 0
+
+    def acquire(self) -> None:
+        super().acquire()
+        self.acquired += 1
+
+
+def page(ids, has_more):
+    return stripe.ListObject.construct_from(
+        {
+            "object": "list",
+            "data": [{"id": item_id, "email": f"{item_id}@example.com"} for item_id in ids],
+            "has_more": has_more,
+            "url": "/v1/customers"
+        },
+        "sk_test"
+    )
+
+
+def test_try_acquire_never_waits():
+    limiter = RateLimiter(rate=1.0, burst=2.0)
+    assert limiter.try_acquire()
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+
+
+def test_acquire_fails_if_wait_is_too_long():
+    limiter = RateLimiter(rate=1.0, burst=1.0, max_wait=0.5)
+    limiter.acquire()
+    with pytest.raises(RateLimitExceededException):
+        limiter.acquire()
+
+
+def test_every_page_takes_token_and_goes_through_breaker():
+    limiter = CountingLimiter(rate=1000.0)
+    breaker = CircuitBreaker("Customer")
+    api = StripeCustomerApi("sk_test", rate_limiter=limiter, circuit_breaker=breaker)
+    pages = [page(["cus_3", "cus_2"], True), page(["cus_1"], False)]
+    with mock.patch("stripe.Customer.list", side_effect=pages) as customer_list:
+        emails = list(api._list_lookup_values())
+    assert emails == ["cus_3@example.com", "cus_2@example.com", "cus_1@example.com"]
+    assert limiter.acquired == 2
+    assert len(breaker._window) == 2
+    assert customer_list.call_args_list[1].kwargs["starting_after"] == "cus_2"
+
+
+def test_list_all_starts_after_given_subscription():
+    api = StripeSubscriptionApi("sk_test")
+    with mock.patch("stripe.Subscription.list", return_value=page([], False)) as subscription_list:
+        assert list(api.list_all(starting_after="sub_1")) == []
+    subscription_list.assert_called_once_with(
+        status="all", starting_after="sub_1", limit=100, api_key="sk_test"
+    )
+
+
+def test_token_wait_isnt_counted_as_slow_call():
+    clock = {"now": 1000.0}
+
+    def acquire():
+        clock["now"] += 10.0
+
+    breaker = CircuitBreaker("Customer", slow_call_threshold=1.0, window_size=2, minimum_calls=2)
+    with mock.patch("time.monotonic", lambda: clock["now"]):
+        for _ in range(3):
+            breaker.write(lambda: "value", acquire)
+    assert breaker.state == CircuitStateEnum.closed
+    assert list(breaker._window) == [True, True]
+
+
+def test_rejected_probe_token_releases_probe():
+    breaker = CircuitBreaker("Customer", window_size=2, minimum_calls=2, reset_timeout=0.0)
+
+    def fail():
+        raise stripe.error.APIConnectionError("Stripe is down")
+
+    for _ in range(2):
+        with pytest.raises(stripe.error.APIConnectionError):
+            breaker.write(fail)
+
+    def reject():
+        raise RateLimitExceededException("Rate limit")
+
+    with pytest.raises(RateLimitExceededException):
+        breaker.write(lambda: "value", reject)
+    assert breaker.write(lambda: "value") == "value"
+    assert breaker.state == CircuitStateEnum.closed
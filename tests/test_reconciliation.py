@@ -0,0 +1,195 @@
+import datetime
+from unittest import mock
+
+import pytest
+import stripe
+
+from stripe_subscription.base_api import StripeSubscriptionApi
+from stripe_subscription.exceptions import UnsortedRecordsException
+from stripe_subscription.reconciliation import (
+    LocalSubscriptionRecord,
+    ReconciliationCursor,
+    SubscriptionDiffTypeEnum,
+    SubscriptionReconciler
+)
+
+START = datetime.datetime(2023, 1, 1)
+PERIOD_END = datetime.datetime(2023, 2, 1)
+
+
+def timestamp(created):
+    return int(created.replace(tzinfo=datetime.timezone.utc).timestamp())
+
+
+def subscription(sub_id, created, status="active", price_id="price_1", period_end=PERIOD_END):
+    return {
+        "id": sub_id,
+        "object": "subscription",
+        "customer": "cus_1",
+        "status": status,
+        "created": timestamp(created),
+        "current_period_end": timestamp(period_end),
+        "items": {
+            "object": "list",
+            "data": [
+                {
+                    "id": f"si_{sub_id}",
+                    "quantity": 1,
+                    "price": {
+                        "id": price_id,
+                        "unit_amount": 1000,
+                        "currency": "usd",
+                        "recurring": {"interval": "month", "interval_count": 1},
+                        "product": "prod_1"
+                    }
+                }
+            ]
+        }
+    }
+
+
+def local(sub_id, created, status="active", price_id="price_1", period_end=PERIOD_END):
+    return LocalSubscriptionRecord(
+        id=sub_id,
+        customer="cus_1",
+        status=status,
+        created=created,
+        current_period_end=period_end,
+        price_ids=[price_id]
+    )
+
+
+class FakeSubscriptionList:
+    """
+    Pages of Stripe subscriptions (the newest first) like Subscription.list.
+    """
+
+    def __init__(self, subscriptions, page_size=2) -> None:
+        self.subscriptions = subscriptions
+        self.page_size = page_size
+        self.calls = []
+
+    def __call__(self, status=None, limit=None, starting_after=None, api_key=None):
+        self.calls.append(starting_after)
+        start = 0
+        if starting_after is not None:
+            ids = [sub["id"] for sub in self.subscriptions]
+            start = ids.index(starting_after) + 1
+        data = self.subscriptions[start:start + self.page_size]
+        return stripe.ListObject.construct_from(
+            {
+                "object": "list",
+                "data": data,
+                "has_more": start + self.page_size < len(self.subscriptions),
+                "url": "/v1/subscriptions"
+            },
+            "sk_test"
+        )
+
+
+def at(seconds):
+    return START - datetime.timedelta(seconds=seconds)
+
+
+STRIPE = [
+    subscription("sub_new", at(0)),
+    subscription("sub_a", at(10)),
+    subscription("sub_b", at(10), status="past_due"),
+    subscription("sub_period", at(20), period_end=PERIOD_END + datetime.timedelta(days=1)),
+    subscription("sub_price", at(30), price_id="price_2"),
+    subscription("sub_ok", at(40)),
+]
+
+LOCAL = [
+    local("sub_b", at(10)),
+    local("sub_a", at(10)),
+    local("sub_period", at(20)),
+    local("sub_gone", at(25)),
+    local("sub_price", at(30)),
+    local("sub_ok", at(40)),
+]
+
+
+@pytest.fixture
+def reconciler():
+    return SubscriptionReconciler(StripeSubscriptionApi("sk_test"))
+
+
+def run(reconciler, local_records, cursor=None, subscriptions=STRIPE):
+    fake_list = FakeSubscriptionList(subscriptions)
+    with mock.patch("stripe.Subscription.list", side_effect=fake_list):
+        diffs = [(diff.type, diff.subscription_id) for diff in reconciler.diff(local_records, cursor)]
+    return diffs, fake_list
+
+
+EXPECTED = [
+    (SubscriptionDiffTypeEnum.missing_locally, "sub_new"),
+    (SubscriptionDiffTypeEnum.status_mismatch, "sub_b"),
+    (SubscriptionDiffTypeEnum.period_mismatch, "sub_period"),
+    (SubscriptionDiffTypeEnum.missing_in_stripe, "sub_gone"),
+    (SubscriptionDiffTypeEnum.price_mismatch, "sub_price"),
+]
+
+
+def test_all_diff_types(reconciler):
+    diffs, fake_list = run(reconciler, LOCAL)
+    assert diffs == EXPECTED
+    assert fake_list.calls == [None, "sub_a", "sub_period"]
+
+
+def test_diff_values(reconciler):
+    fake_list = FakeSubscriptionList(STRIPE)
+    with mock.patch("stripe.Subscription.list", side_effect=fake_list):
+        diffs = {diff.subscription_id: diff for diff in reconciler.diff(LOCAL)}
+    assert diffs["sub_b"].local_value == "active"
+    assert diffs["sub_b"].stripe_value == "past_due"
+    assert diffs["sub_price"].local_value == ["price_1"]
+    assert diffs["sub_price"].stripe_value == ["price_2"]
+    assert diffs["sub_new"].local is None
+    assert diffs["sub_gone"].stripe is None
+
+
+def test_same_second_records_are_matched_by_id(reconciler):
+    stripe_records = [subscription(f"sub_{number}", at(0)) for number in range(5)]
+    local_records = [local(f"sub_{number}", at(0)) for number in reversed(range(5))]
+    diffs, _ = run(reconciler, local_records, subscriptions=stripe_records)
+    assert diffs == []
+    assert reconciler.stats.stripe_count == 5
+    assert reconciler.stats.local_count == 5
+
+
+def test_unsorted_local_records(reconciler):
+    with pytest.raises(UnsortedRecordsException):
+        run(reconciler, [local("sub_ok", at(40)), local("sub_a", at(10))])
+
+
+def test_stats(reconciler):
+    run(reconciler, LOCAL)
+    assert reconciler.stats.stripe_count == len(STRIPE)
+    assert reconciler.stats.local_count == len(LOCAL)
+    assert reconciler.stats.diffs_count == len(EXPECTED)
+    assert reconciler.stats.elapsed > 0
+    assert reconciler.cursor == ReconciliationCursor(created=at(40), stripe_starting_after="sub_ok")
+
+
+@pytest.mark.parametrize("handled", range(1, len(EXPECTED)))
+def test_resume_from_cursor(reconciler, handled):
+    fake_list = FakeSubscriptionList(STRIPE)
+    diffs = []
+    with mock.patch("stripe.Subscription.list", side_effect=fake_list):
+        for diff in reconciler.diff(LOCAL):
+            diffs.append((diff.type, diff.subscription_id))
+            cursor = reconciler.cursor
+            if len(diffs) == handled:
+                break
+    local_records = [record for record in LOCAL if record.created < cursor.created]
+    resumed, fake_list = run(SubscriptionReconciler(StripeSubscriptionApi("sk_test")), local_records, cursor)
+    assert diffs + resumed == EXPECTED
+    assert fake_list.calls[0] == cursor.stripe_starting_after
+
+
+def test_resume_skips_processed_local_records(reconciler):
+    cursor = ReconciliationCursor(created=at(10), stripe_starting_after="sub_b")
+    diffs, _ = run(reconciler, LOCAL, cursor)
+    assert diffs == EXPECTED[2:]
+    assert reconciler.stats.local_count == 4
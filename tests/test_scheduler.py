@@ -0,0 +1,116 @@
+import datetime
+
+import pytest
+
+from stripe_subscription.scheduler import SubscriptionIndex, SubscriptionScheduler
+from stripe_subscription.serializers import StripeApiSubscription
+
+NOW = datetime.datetime(2026, 3, 1, 12, 0)
+
+
+def make_subscription(subscription_id, period_end, status="active", **fields):
+    return StripeApiSubscription.construct(
+        id=subscription_id,
+        customer="cus_1",
+        status=status,
+        created=NOW - datetime.timedelta(days=60),
+        current_period_end=period_end,
+        **fields
+    )
+
+
+def hours(count):
+    return datetime.timedelta(hours=count)
+
+
+def test_subscription_is_due_once_per_timestamp():
+    index = SubscriptionIndex()
+    subscription = make_subscription("sub_1", NOW - hours(1))
+    index.update(subscription)
+    assert [item.id for due_at, item in index.pop_due(NOW)] == ["sub_1"]
+    assert list(index.pop_due(NOW)) == []
+    index.update(subscription)
+    assert list(index.pop_due(NOW)) == []
+    index.update(make_subscription("sub_1", NOW + hours(1)))
+    assert [item.id for due_at, item in index.pop_due(NOW + hours(2))] == ["sub_1"]
+
+
+def test_due_subscriptions_are_ordered_and_filtered_by_status():
+    index = SubscriptionIndex(statuses=["active"])
+    index.update_many([
+        make_subscription("sub_2", NOW - hours(1)),
+        make_subscription("sub_1", NOW - hours(2)),
+        make_subscription("sub_3", NOW + hours(1)),
+        make_subscription("sub_4", NOW - hours(3), status="canceled"),
+    ])
+    assert [item.id for due_at, item in index.due(NOW)] == ["sub_1", "sub_2"]
+    assert [item.id for due_at, item in index.upcoming(NOW + hours(1))] == [
+        "sub_1", "sub_2", "sub_3"
+    ]
+    assert index.next_due_at() == NOW - hours(2)
+
+
+def test_subscription_stays_due_if_processing_failed():
+    index = SubscriptionIndex()
+    index.update_many([
+        make_subscription("sub_1", NOW - hours(2)),
+        make_subscription("sub_2", NOW - hours(1)),
+    ])
+    for due_at, subscription in index.pop_due(NOW):
+        break
+    assert [item.id for due_at, item in index.due(NOW)] == ["sub_1", "sub_2"]
+
+
+def test_failed_callback_doesnt_lose_other_jobs():
+    calls = []
+    failing = {"sub_1"}
+
+    def reminder(subscription):
+        if subscription.id in failing:
+            raise RuntimeError("mail server is down")
+        calls.append(("reminder", subscription.id))
+
+    def dunning(subscription):
+        calls.append(("dunning", subscription.id))
+
+    scheduler = SubscriptionScheduler()
+    scheduler.add_job("reminder", reminder, offset=-hours(1))
+    scheduler.add_job("dunning", dunning)
+    scheduler.update_many([
+        make_subscription("sub_1", NOW - hours(2)),
+        make_subscription("sub_2", NOW - hours(1)),
+    ])
+    with pytest.raises(RuntimeError):
+        scheduler.run_due(NOW)
+    assert calls == []
+    failing.clear()
+    assert scheduler.run_due(NOW) == 4
+    assert calls == [
+        ("reminder", "sub_1"),
+        ("dunning", "sub_1"),
+        ("reminder", "sub_2"),
+        ("dunning", "sub_2"),
+    ]
+    assert scheduler.run_due(NOW) == 0
+
+
+def test_old_subscriptions_and_fired_marks_are_pruned():
+    index = SubscriptionIndex(max_lateness=datetime.timedelta(days=1))
+    index.update(make_subscription("sub_1", NOW - hours(1)))
+    assert len(list(index.pop_due(NOW))) == 1
+    assert "sub_1" in index._fired_at
+    later = NOW + datetime.timedelta(days=2)
+    assert index.due(later) == []
+    assert index._fired_at == {}
+    # Subscription due longer than max_lateness ago isn't indexed again.
+    index.update(make_subscription("sub_1", NOW - hours(1)))
+    index.update(make_subscription("sub_2", later - hours(1)))
+    assert [item.id for due_at, item in index.due(later)] == ["sub_2"]
+
+
+def test_late_subscription_is_dropped_without_firing():
+    index = SubscriptionIndex(max_lateness=datetime.timedelta(days=1))
+    index.update(make_subscription("sub_1", NOW - datetime.timedelta(days=2)))
+    index.update(make_subscription("sub_2", NOW - hours(1)))
+    assert [item.id for due_at, item in index.due(NOW)] == ["sub_2"]
+    assert len(index) == 1
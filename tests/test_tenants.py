@@ -0,0 +1,81 @@
+import threading
+from unittest import mock
+
+import stripe
+
+from stripe_subscription.async_sub_service import AsyncStripeSubscriptionService
+from stripe_subscription.tenants import StripeServiceRegistry
+
+
+def customer(customer_id):
+    return {
+        "id": customer_id,
+        "email": f"{customer_id}@example.com",
+        "object": "customer",
+        "balance": 0,
+        "created": 1672531200
+    }
+
+
+def test_least_recently_used_service_is_evicted():
+    registry = StripeServiceRegistry(max_size=2)
+    first = registry.get("sk_1")
+    registry.get("sk_2")
+    assert registry.get("sk_1") is first
+    registry.get("sk_3")
+    assert len(registry) == 2
+    assert registry.get("sk_1") is first
+    assert "sk_2" not in registry._services
+
+
+def test_idle_service_is_evicted():
+    registry = StripeServiceRegistry(idle_timeout=10.0)
+    with mock.patch("time.monotonic", return_value=100.0):
+        first = registry.get("sk_1")
+        registry.get("sk_2")
+    with mock.patch("time.monotonic", return_value=105.0):
+        registry.get("sk_2")
+    with mock.patch("time.monotonic", return_value=111.0):
+        registry.get("sk_3")
+        assert list(registry._services) == ["sk_2", "sk_3"]
+        assert registry.get("sk_1") is not first
+
+
+def test_service_is_shared_by_threads():
+    registry = StripeServiceRegistry()
+    barrier = threading.Barrier(8)
+    services = []
+
+    def get_service():
+        barrier.wait()
+        services.append(registry.get("sk_1"))
+
+    threads = [threading.Thread(target=get_service) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(services) == 8
+    assert all(service is services[0] for service in services)
+
+
+def test_tenants_send_their_own_api_key():
+    registry = StripeServiceRegistry()
+    global_api_key = stripe.api_key
+
+    def retrieve(customer_id, api_key=None, **params):
+        return customer(customer_id)
+
+    with mock.patch("stripe.Customer.retrieve", side_effect=retrieve) as customer_retrieve:
+        assert registry.get("sk_1").customer_api.get_by_id("cus_1").id == "cus_1"
+        assert registry.get("sk_2").customer_api.get_by_id("cus_2").id == "cus_2"
+    assert [call.kwargs["api_key"] for call in customer_retrieve.call_args_list] == ["sk_1", "sk_2"]
+    assert stripe.api_key == global_api_key
+
+
+def test_async_service_wraps_shared_service():
+    registry = StripeServiceRegistry()
+    async_service = registry.get_async("sk_1")
+    assert isinstance(async_service, AsyncStripeSubscriptionService)
+    assert async_service.sync_service is registry.get("sk_1")
+    assert async_service.api_key == "sk_1"
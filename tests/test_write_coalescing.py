@@ -0,0 +1,104 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from stripe_subscription.base_api import StripeCustomerApi
+from stripe_subscription.write_coalescing import WriteCoalescer, merge_fields
+
+
+class RecordingApply:
+
+    def __init__(self, block_first: bool = False) -> None:
+        self.calls = []
+        self.first_started = threading.Event()
+        self.release_first = threading.Event()
+        if not block_first:
+            self.release_first.set()
+
+    def __call__(self, key, fields):
+        self.calls.append((key, fields))
+        if len(self.calls) == 1:
+            self.first_started.set()
+            self.release_first.wait(5)
+        return {"key": key, "version": len(self.calls)}
+
+
+def test_merge_fields_merges_nested_dicts():
+    target = {"name": "Old", "metadata": {"plan": "free", "source": "web"}}
+    merge_fields(target, {"name": "New", "metadata": {"plan": "pro"}})
+    assert target == {"name": "New", "metadata": {"plan": "pro", "source": "web"}}
+
+
+def test_writes_within_window_are_merged():
+    apply = RecordingApply()
+    coalescer = WriteCoalescer(apply, window=0.05)
+    first = coalescer.submit("cus_1", {"name": "First", "metadata": {"a": "1"}})
+    second = coalescer.submit("cus_1", {"name": "Second", "metadata": {"b": "2"}})
+    other = coalescer.submit("cus_2", {"name": "Other"})
+    assert first.result(5) is second.result(5)
+    assert other.result(5)["key"] == "cus_2"
+    assert sorted(apply.calls, key=lambda call: call[0]) == [
+        ("cus_1", {"name": "Second", "metadata": {"a": "1", "b": "2"}}),
+        ("cus_2", {"name": "Other"}),
+    ]
+
+
+def test_writes_made_during_apply_go_to_next_batch_in_order():
+    apply = RecordingApply(block_first=True)
+    coalescer = WriteCoalescer(apply, window=0.01)
+    first = coalescer.submit("cus_1", {"name": "First"})
+    assert apply.first_started.wait(5)
+    second = coalescer.submit("cus_1", {"name": "Second"})
+    third = coalescer.submit("cus_1", {"phone": "123"})
+    time.sleep(0.05)
+    # Next batch waits until write in flight is finished.
+    assert len(apply.calls) == 1
+    apply.release_first.set()
+    assert first.result(5)["version"] == 1
+    assert second.result(5) is third.result(5)
+    assert apply.calls == [
+        ("cus_1", {"name": "First"}),
+        ("cus_1", {"name": "Second", "phone": "123"}),
+    ]
+
+
+def test_error_is_set_to_all_futures_of_batch():
+    def apply(key, fields):
+        raise ValueError("Stripe error")
+
+    coalescer = WriteCoalescer(apply, window=0.01)
+    futures = [coalescer.submit("cus_1", {"name": str(number)}) for number in range(3)]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(5)
+
+
+def test_scheduler_thread_stops_when_idle():
+    coalescer = WriteCoalescer(RecordingApply(), window=0.01)
+    coalescer.submit("cus_1", {"name": "Name"}).result(5)
+    for _ in range(100):
+        if coalescer._scheduler is None:
+            break
+        time.sleep(0.01)
+    assert coalescer._scheduler is None
+    assert coalescer.submit("cus_1", {"name": "Other"}).result(5)["version"] == 2
+
+
+def test_modify_coalesced_without_options_modifies_at_once():
+    api = StripeCustomerApi("sk_test")
+    assert api.write_coalescer is None
+    customer = {
+        "id": "cus_1",
+        "email": "email@example.com",
+        "object": "customer",
+        "balance": 0,
+        "created": 1672531200,
+        "name": "Name"
+    }
+    with mock.patch("stripe.Customer.modify", return_value=customer) as modify:
+        future = api.modify_coalesced("cus_1", name="Name")
+        assert future.done()
+        assert future.result().name == "Name"
+    modify.assert_called_once_with("cus_1", name="Name", api_key="sk_test")